@@ -4,11 +4,21 @@ Provides comprehensive usage metrics, performance tracking, and insights
 """
 
 import sqlite3
+import io
 import json
+import logging
 import os
+import atexit
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple, BinaryIO, NamedTuple, Iterable, Iterator
 import streamlit as st
 import pandas as pd
 
@@ -22,32 +32,209 @@ except ImportError:
     PLOTLY_AVAILABLE = False
     px = go = make_subplots = None
 
+# Optional orjson for faster encoding of tracking metadata
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Hot-path INSERT statements (module-level so the connection statement cache is reused)
+EVENT_INSERT_SQL = """
+    INSERT INTO analytics_events
+    (id, timestamp, event_type, user_id, session_id, metadata, query, response_length, ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+PERFORMANCE_INSERT_SQL = """
+    INSERT INTO performance_metrics
+    (id, timestamp, metric_type, value, metadata, ts)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+ENGAGEMENT_INSERT_SQL = """
+    INSERT INTO document_engagement
+    (id, document_name, timestamp, engagement_type, relevance_score, chunk_index, query, ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Incremental upserts into the daily roll-up tables (applied in the same flush transaction)
+EVENTS_DAILY_UPSERT_SQL = """
+    INSERT INTO events_daily (day, event_type, count) VALUES (?, ?, ?)
+    ON CONFLICT(day, event_type) DO UPDATE SET count = count + excluded.count
+"""
+
+SESSIONS_DAILY_INSERT_SQL = """
+    INSERT OR IGNORE INTO sessions_daily (day, session_id) VALUES (?, ?)
+"""
+
+PERF_DAILY_UPSERT_SQL = """
+    INSERT INTO perf_daily (day, metric_type, sum_value, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(day, metric_type) DO UPDATE SET
+        sum_value = sum_value + excluded.sum_value,
+        count = count + excluded.count
+"""
+
+ENGAGEMENT_DAILY_UPSERT_SQL = """
+    INSERT INTO engagement_daily
+    (day, document_name, engagement_type, count, sum_relevance, relevant_count, relevant_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, document_name, engagement_type) DO UPDATE SET
+        count = count + excluded.count,
+        sum_relevance = sum_relevance + excluded.sum_relevance,
+        relevant_count = relevant_count + excluded.relevant_count,
+        relevant_sum = relevant_sum + excluded.relevant_sum
+"""
+
+# Buffered tracking rows are flushed once this many are pending or every FLUSH_INTERVAL_SECONDS
+FLUSH_BATCH_SIZE = 128
+FLUSH_INTERVAL_SECONDS = 1.0
+# Rows handed to the writer thread; tracking calls drop rows rather than block when full
+TRACKING_QUEUE_MAXSIZE = 10_000
+# How often the writer thread refreshes planner statistics with PRAGMA optimize
+OPTIMIZE_INTERVAL_SECONDS = 3600
+# Read-only connections shared by the dashboard/report queries (WAL allows concurrent readers)
+READ_POOL_SIZE = 4
+
+# Fast-write SQLite settings applied once to the long-lived tracking connection
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-64000;
+    PRAGMA busy_timeout=5000;
+"""
+
 
-@dataclass
-class AnalyticsEvent:
-    """Represents a single analytics event"""
+# Dashboard aggregates as tagged SELECTs, one row shape for all: (tag, key, sub_key, count, value).
+# Grouped by result section; get_dashboard_bundle unions every section into one statement and
+# the per-section getters run only their own, so each aggregate is written once
+DASHBOARD_SECTION_SQL: Dict[str, Tuple[str, ...]] = {
+    "usage_stats": (
+        """SELECT 'event_type', event_type, NULL, SUM(count), NULL
+        FROM events_daily WHERE day >= :since_day GROUP BY event_type""",
+        """SELECT 'daily', day, NULL, SUM(count), NULL
+        FROM events_daily WHERE day >= :since_day GROUP BY day""",
+        """SELECT 'sessions', NULL, NULL, COUNT(DISTINCT session_id), NULL
+        FROM sessions_daily WHERE day >= :since_day""",
+    ),
+    "document_analytics": (
+        """SELECT * FROM (
+            SELECT 'document', document_name, NULL, SUM(count), SUM(sum_relevance) / SUM(count)
+            FROM engagement_daily WHERE day >= :since_day
+            GROUP BY document_name ORDER BY SUM(count) DESC LIMIT 10
+        )""",
+        """SELECT 'engagement_type', engagement_type, NULL, SUM(count), NULL
+        FROM engagement_daily WHERE day >= :since_day GROUP BY engagement_type""",
+        """SELECT 'relevance', day, NULL, NULL, SUM(relevant_sum) / SUM(relevant_count)
+        FROM engagement_daily WHERE day >= :since_day
+        GROUP BY day HAVING SUM(relevant_count) > 0""",
+    ),
+    "performance_analytics": (
+        """SELECT CASE WHEN metric_type LIKE '%_time' THEN 'performance_time' ELSE 'performance' END,
+               day, metric_type, count, sum_value
+        FROM perf_daily WHERE day >= :since_day""",
+    ),
+    "popular_queries": (
+        """SELECT * FROM (
+            SELECT 'query', query, NULL, COUNT(*), AVG(response_length)
+            FROM analytics_events
+            WHERE event_type = 'query' AND ts >= :since_ts AND query IS NOT NULL
+            GROUP BY query ORDER BY COUNT(*) DESC LIMIT :query_limit
+        )""",
+    ),
+}
+
+
+def _dumps_metadata(metadata: Optional[Dict[str, Any]]) -> str:
+    """Compact JSON for stored metadata; empty metadata short-circuits to '{}'"""
+    if not metadata:
+        return "{}"
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(metadata).decode()
+        except TypeError:
+            pass  # e.g. non-str keys; stdlib handles these
+    return json.dumps(metadata, separators=(",", ":"))
+
+
+def _dumps_export(value: Any) -> bytes:
+    """Indented JSON bytes for one export section"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(value, default=str, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    return json.dumps(value, indent=2, default=str).encode("utf-8")
+
+
+class AnalyticsEvent(NamedTuple):
+    """Represents a single analytics event (immutable tuple; metadata None means empty)"""
     id: str
     timestamp: datetime
     event_type: str  # 'message', 'document_upload', 'query', 'rag_retrieval', 'model_switch'
     user_id: str = "anonymous"
     session_id: str = ""
     metadata: Optional[Dict[str, Any]] = None
-    
-    def __post_init__(self):
-        if self.metadata is None:
-            self.metadata = {}
 
 
 class AnalyticsTracker:
-    """Tracks and analyzes chatbot usage patterns"""
+    """Tracks and analyzes chatbot usage patterns
+    
+    Planner statistics are maintained automatically: ANALYZE runs once when the
+    database is initialized and the writer thread issues PRAGMA optimize hourly.
+    """
     
     def __init__(self, db_path: str = "analytics.db"):
         self.db_path = db_path
+        # Single long-lived connection for tracking writes (autocommit, shared across threads).
+        # Opened by absolute URI with a shared cache; WAL + busy_timeout let concurrent
+        # Streamlit workers wait on the writer lock instead of failing.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self._connection_uri(db_path), uri=True,
+            check_same_thread=False, isolation_level=None
+        )
+        self._conn.executescript(CONNECTION_PRAGMAS)
+        journal_mode = self._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if str(journal_mode).lower() != "wal":
+            st.warning(f"Analytics database is not in WAL mode ('{journal_mode}'); concurrent workers may block each other")
         self._init_database()
+        
+        # Private-cache read-only connections: a shared cache would make readers wait on
+        # the writer's table locks, defeating WAL's concurrent reads
+        self._read_pool: queue.Queue = queue.Queue()
+        for _ in range(READ_POOL_SIZE):
+            self._read_pool.put(sqlite3.connect(
+                f"{Path(db_path).resolve().as_uri()}?mode=ro&cache=private", uri=True,
+                check_same_thread=False
+            ))
+        
+        # track_* only enqueue; the writer thread moves rows into the per-table
+        # buffers, which flush() writes in one transaction
+        self._q: queue.Queue = queue.Queue(maxsize=TRACKING_QUEUE_MAXSIZE)
+        self._ev_buf: deque = deque()
+        self._perf_buf: deque = deque()
+        self._eng_buf: deque = deque()
+        self._buffers = {"event": self._ev_buf, "performance": self._perf_buf, "engagement": self._eng_buf}
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._drain, name="analytics-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush_and_close)
+    
+    @staticmethod
+    def _connection_uri(db_path: str) -> str:
+        """SQLite URI for the tracking connection (absolute path, create if missing, shared cache)"""
+        return f"{Path(db_path).resolve().as_uri()}?mode=rwc&cache=shared"
     
     def _init_database(self):
         """Initialize the analytics database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            conn = self._conn
             # Events table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS analytics_events (
@@ -84,29 +271,331 @@ class AnalyticsTracker:
                 )
             """)
             
-            # Create indexes for better performance
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_timestamp ON analytics_events(timestamp)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type ON analytics_events(event_type)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_performance_timestamp ON performance_metrics(timestamp)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_engagement_document ON document_engagement(document_name)")
+            # Integer epoch-millisecond timestamps for range filters (backfilled once from the ISO text)
+            for table in ("analytics_events", "performance_metrics", "document_engagement"):
+                if self._add_column(conn, table, "ts INTEGER"):
+                    conn.execute(
+                        f"UPDATE {table} SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000"
+                    )
+            # TEXT timestamp indexes are superseded by the integer ts indexes
+            conn.execute("DROP INDEX IF EXISTS idx_events_timestamp")
+            conn.execute("DROP INDEX IF EXISTS idx_performance_timestamp")
+            
+            # Create indexes for better performance. Apart from popular queries (idx_events_query
+            # below), the raw tables are only read for MAX(ts), the dashboard cache key; other
+            # aggregates come from the roll-ups, so further indexes would only slow tracking inserts
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON analytics_events(ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_performance_ts ON performance_metrics(ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_engagement_ts ON document_engagement(ts)")
+            conn.execute("DROP INDEX IF EXISTS idx_events_type")  # prefix of idx_events_query
+            conn.execute("DROP INDEX IF EXISTS idx_engagement_document")
+            
+            # Daily bucket as an indexed generated column so GROUP BY day avoids DATE() per row
+            # (SQLite only allows VIRTUAL generated columns to be added via ALTER TABLE)
+            for table in ("analytics_events", "performance_metrics", "document_engagement"):
+                self._add_column(
+                    conn, table,
+                    "day TEXT GENERATED ALWAYS AS (substr(timestamp, 1, 10)) VIRTUAL"
+                )
+            # Only the one-time roll-up backfill groups raw rows by day, so the column is not indexed
+            for index in ("idx_events_day", "idx_performance_day", "idx_engagement_day"):
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+            
+            # Query fields promoted out of the metadata JSON (backfilled once for existing rows)
+            added_query = self._add_column(conn, "analytics_events", "query TEXT")
+            added_length = self._add_column(conn, "analytics_events", "response_length INTEGER")
+            if added_query or added_length:
+                conn.execute("""
+                    UPDATE analytics_events
+                    SET query = JSON_EXTRACT(metadata, '$.query'),
+                        response_length = JSON_EXTRACT(metadata, '$.response_length')
+                """)
+            conn.execute("DROP INDEX IF EXISTS idx_events_type_ts")  # previously (event_type, timestamp)
+            conn.execute("DROP INDEX IF EXISTS idx_events_type_epoch")  # prefix of idx_events_query
+            # Covering index: popular-queries is answered from the index alone, no JSON parsing or table lookups
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_events_query
+                ON analytics_events(event_type, ts, query, response_length)
+            """)
+            
+            self._init_rollups(conn)
+            
+            # Collect index statistics so the planner picks the right index for range sizes
+            conn.execute("ANALYZE")
+    
+    @staticmethod
+    def _init_rollups(conn: sqlite3.Connection):
+        """Create the daily roll-up tables, backfilling them from raw rows on first creation"""
+        existing = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events_daily (
+                day TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, event_type)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions_daily (
+                day TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                PRIMARY KEY (day, session_id)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS perf_daily (
+                day TEXT NOT NULL,
+                metric_type TEXT NOT NULL,
+                sum_value REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, metric_type)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS engagement_daily (
+                day TEXT NOT NULL,
+                document_name TEXT NOT NULL,
+                engagement_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                sum_relevance REAL NOT NULL DEFAULT 0,
+                relevant_count INTEGER NOT NULL DEFAULT 0,
+                relevant_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, document_name, engagement_type)
+            )
+        """)
+        
+        if "events_daily" not in existing:
+            conn.execute("""
+                INSERT INTO events_daily (day, event_type, count)
+                SELECT day, event_type, COUNT(*) FROM analytics_events GROUP BY day, event_type
+            """)
+        if "sessions_daily" not in existing:
+            conn.execute("""
+                INSERT OR IGNORE INTO sessions_daily (day, session_id)
+                SELECT DISTINCT day, session_id FROM analytics_events WHERE session_id != ''
+            """)
+        if "perf_daily" not in existing:
+            conn.execute("""
+                INSERT INTO perf_daily (day, metric_type, sum_value, count)
+                SELECT day, metric_type, SUM(value), COUNT(*) FROM performance_metrics GROUP BY day, metric_type
+            """)
+        if "engagement_daily" not in existing:
+            conn.execute("""
+                INSERT INTO engagement_daily
+                (day, document_name, engagement_type, count, sum_relevance, relevant_count, relevant_sum)
+                SELECT day, document_name, engagement_type, COUNT(*), SUM(relevance_score),
+                       SUM(relevance_score > 0), SUM(CASE WHEN relevance_score > 0 THEN relevance_score ELSE 0 END)
+                FROM document_engagement
+                GROUP BY day, document_name, engagement_type
+            """)
+    
+    @staticmethod
+    def _update_rollups(conn: sqlite3.Connection, ev_batch: List[tuple], perf_batch: List[tuple], eng_batch: List[tuple]):
+        """Fold a flushed batch of raw rows into the daily roll-up tables"""
+        events: Dict[Tuple[str, str], int] = {}
+        sessions = set()
+        for row in ev_batch:
+            day = row[1][:10]
+            key = (day, row[2])
+            events[key] = events.get(key, 0) + 1
+            if row[4]:
+                sessions.add((day, row[4]))
+        
+        perf: Dict[Tuple[str, str], List[float]] = {}
+        for row in perf_batch:
+            acc = perf.setdefault((row[1][:10], row[2]), [0.0, 0])
+            acc[0] += row[3]
+            acc[1] += 1
+        
+        engagement: Dict[Tuple[str, str, str], List[float]] = {}
+        for row in eng_batch:
+            acc = engagement.setdefault((row[2][:10], row[1], row[3]), [0, 0.0, 0, 0.0])
+            relevance = row[4] or 0
+            acc[0] += 1
+            acc[1] += relevance
+            if relevance > 0:
+                acc[2] += 1
+                acc[3] += relevance
+        
+        if events:
+            conn.executemany(EVENTS_DAILY_UPSERT_SQL, [(*k, v) for k, v in events.items()])
+        if sessions:
+            conn.executemany(SESSIONS_DAILY_INSERT_SQL, list(sessions))
+        if perf:
+            conn.executemany(PERF_DAILY_UPSERT_SQL, [(*k, *v) for k, v in perf.items()])
+        if engagement:
+            conn.executemany(ENGAGEMENT_DAILY_UPSERT_SQL, [(*k, *v) for k, v in engagement.items()])
+    
+    @staticmethod
+    def _add_column(conn: sqlite3.Connection, table: str, column_ddl: str) -> bool:
+        """Add a column to an existing table; returns False if it was already present"""
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_ddl}")
+            return True
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e).lower():
+                raise
+            return False
+    
+    def _drain(self):
+        """Writer thread: move queued rows into the batch buffers and flush periodically"""
+        last_flush = last_optimize = time.monotonic()
+        while not self._closed.is_set():
+            try:
+                kind, row = self._q.get(timeout=FLUSH_INTERVAL_SECONDS)
+                self._buffers[kind].append(row)
+            except queue.Empty:
+                pass
+            if (self._pending() >= FLUSH_BATCH_SIZE
+                    or time.monotonic() - last_flush >= FLUSH_INTERVAL_SECONDS):
+                try:
+                    self.flush()
+                except Exception as e:
+                    # flush() keeps the batch buffered, so the next interval retries it
+                    logger.error("Background analytics flush failed; %d rows kept for retry: %s", self._pending(), e)
+                last_flush = time.monotonic()
+            if time.monotonic() - last_optimize >= OPTIMIZE_INTERVAL_SECONDS:
+                self._optimize()
+                last_optimize = time.monotonic()
+    
+    def _optimize(self):
+        """Refresh planner statistics for tables whose contents changed significantly"""
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+    
+    def _pending(self) -> int:
+        return len(self._ev_buf) + len(self._perf_buf) + len(self._eng_buf)
+    
+    def _enqueue(self, kind: str, row: tuple) -> bool:
+        """Hand a row to the writer thread without blocking; drops it if the queue is full"""
+        try:
+            self._q.put_nowait((kind, row))
+            return True
+        except queue.Full:
+            return False
+    
+    @staticmethod
+    def _insert_batch(conn: sqlite3.Connection, sql: str, batch: List[tuple]) -> List[tuple]:
+        """Insert a batch in one executemany, falling back to row-by-row when a row violates a
+        constraint so one bad row (e.g. a duplicate id) does not sink the rest; returns the rows written"""
+        conn.execute("SAVEPOINT insert_batch")
+        try:
+            conn.executemany(sql, batch)
+            conn.execute("RELEASE insert_batch")
+            return batch
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK TO insert_batch")
+            conn.execute("RELEASE insert_batch")
+        written = []
+        for row in batch:
+            try:
+                conn.execute(sql, row)
+                written.append(row)
+            except sqlite3.IntegrityError as e:
+                logger.warning("Skipping analytics row %r: %s", row[0], e)
+        return written
+    
+    def flush(self):
+        """Write all queued and buffered tracking rows in a single transaction
+        
+        Rows that violate a constraint are skipped; on any other failure the batch is put
+        back in the buffers for the next flush and the error is re-raised.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            while True:
+                try:
+                    kind, row = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                self._buffers[kind].append(row)
+            ev_batch = [self._ev_buf.popleft() for _ in range(len(self._ev_buf))]
+            perf_batch = [self._perf_buf.popleft() for _ in range(len(self._perf_buf))]
+            eng_batch = [self._eng_buf.popleft() for _ in range(len(self._eng_buf))]
+            if not (ev_batch or perf_batch or eng_batch):
+                return
+            try:
+                self._conn.execute("BEGIN")
+                try:
+                    ev_written = self._insert_batch(self._conn, EVENT_INSERT_SQL, ev_batch) if ev_batch else []
+                    perf_written = self._insert_batch(self._conn, PERFORMANCE_INSERT_SQL, perf_batch) if perf_batch else []
+                    eng_written = self._insert_batch(self._conn, ENGAGEMENT_INSERT_SQL, eng_batch) if eng_batch else []
+                    self._update_rollups(self._conn, ev_written, perf_written, eng_written)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            except Exception:
+                # Nothing was committed: restore the batch ahead of anything buffered since
+                self._ev_buf.extendleft(reversed(ev_batch))
+                self._perf_buf.extendleft(reversed(perf_batch))
+                self._eng_buf.extendleft(reversed(eng_batch))
+                raise
+    
+    def _flush_for_read(self):
+        """Flush before a dashboard read; a failed flush is logged and the read goes ahead"""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Analytics flush failed; rows kept for retry: %s", e)
+    
+    def flush_and_close(self):
+        """Drain pending rows and close the tracking connection (registered with atexit)"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+            while not self._read_pool.empty():
+                self._read_pool.get_nowait().close()
+    
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection from the pool"""
+        if self._closed.is_set():
+            raise sqlite3.ProgrammingError("Analytics tracker is closed")
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+    
+    @staticmethod
+    def _event_row(event: AnalyticsEvent) -> tuple:
+        """Row tuple for EVENT_INSERT_SQL"""
+        # query / response_length live in dedicated columns rather than the JSON blob
+        metadata = dict(event.metadata or {})
+        query = metadata.pop("query", None)
+        response_length = metadata.pop("response_length", None)
+        return (
+            event.id,
+            event.timestamp.isoformat(),
+            event.event_type,
+            event.user_id,
+            event.session_id,
+            _dumps_metadata(metadata),
+            query,
+            response_length,
+            int(event.timestamp.timestamp() * 1000)
+        )
     
     def track_event(self, event: AnalyticsEvent) -> bool:
         """Track a single analytics event"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT INTO analytics_events 
-                    (id, timestamp, event_type, user_id, session_id, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    event.id,
-                    event.timestamp.isoformat(),
-                    event.event_type,
-                    event.user_id,
-                    event.session_id,
-                    json.dumps(event.metadata)
-                ))
-            return True
+            return self._enqueue("event", self._event_row(event))
         except Exception as e:
             st.error(f"Failed to track event: {e}")
             return False
@@ -114,25 +603,17 @@ class AnalyticsTracker:
     def track_performance(self, metric_type: str, value: float, metadata: Optional[Dict[str, Any]] = None) -> bool:
         """Track a performance metric"""
         try:
-            if metadata is None:
-                metadata = {}
-            
-            import hashlib
-            metric_id = hashlib.md5(f"{metric_type}_{datetime.now().timestamp()}".encode()).hexdigest()[:12]
+            metric_id = secrets.token_hex(8)
+            now = time.time()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT INTO performance_metrics 
-                    (id, timestamp, metric_type, value, metadata)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    metric_id,
-                    datetime.now().isoformat(),
-                    metric_type,
-                    value,
-                    json.dumps(metadata)
-                ))
-            return True
+            return self._enqueue("performance", (
+                metric_id,
+                datetime.fromtimestamp(now).isoformat(),
+                metric_type,
+                value,
+                _dumps_metadata(metadata),
+                int(now * 1000)
+            ))
         except Exception:
             return False
     
@@ -146,232 +627,250 @@ class AnalyticsTracker:
     ) -> bool:
         """Track document engagement events"""
         try:
-            import hashlib
-            engagement_id = hashlib.md5(f"{document_name}_{datetime.now().timestamp()}".encode()).hexdigest()[:12]
+            engagement_id = secrets.token_hex(8)
+            now = time.time()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT INTO document_engagement 
-                    (id, document_name, timestamp, engagement_type, relevance_score, chunk_index, query)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    engagement_id,
-                    document_name,
-                    datetime.now().isoformat(),
-                    engagement_type,
-                    relevance_score,
-                    chunk_index,
-                    query
-                ))
-            return True
+            return self._enqueue("engagement", (
+                engagement_id,
+                document_name,
+                datetime.fromtimestamp(now).isoformat(),
+                engagement_type,
+                relevance_score,
+                chunk_index,
+                query,
+                int(now * 1000)
+            ))
         except Exception:
             return False
     
-    def get_usage_stats(self, days: int = 30) -> Dict[str, Any]:
-        """Get usage statistics for the specified period"""
+    @contextmanager
+    def _bulk_load_pragmas(self) -> Iterator[sqlite3.Connection]:
+        """Skip fsyncs for the duration of a bulk load; synchronous=NORMAL is always restored.
+        The journal stays in WAL mode, so a crash can lose the load but not corrupt the database."""
+        conn = self._conn
+        conn.execute("PRAGMA synchronous=OFF")
         try:
-            since_date = (datetime.now() - timedelta(days=days)).isoformat()
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # Total events
-                cursor = conn.execute(
-                    "SELECT COUNT(*) FROM analytics_events WHERE timestamp >= ?", 
-                    (since_date,)
-                )
-                total_events = cursor.fetchone()[0]
-                
-                # Events by type
-                cursor = conn.execute("""
-                    SELECT event_type, COUNT(*) as count 
-                    FROM analytics_events 
-                    WHERE timestamp >= ? 
-                    GROUP BY event_type
-                    ORDER BY count DESC
-                """, (since_date,))
-                events_by_type = dict(cursor.fetchall())
-                
-                # Daily activity
-                cursor = conn.execute("""
-                    SELECT DATE(timestamp) as date, COUNT(*) as count
-                    FROM analytics_events 
-                    WHERE timestamp >= ?
-                    GROUP BY DATE(timestamp)
-                    ORDER BY date
-                """, (since_date,))
-                daily_activity = dict(cursor.fetchall())
-                
-                # Unique sessions
+            yield conn
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+    
+    def bulk_import(self, events: Iterable[AnalyticsEvent], chunk: int = 10_000) -> int:
+        """
+        Insert many events (seeding, migrations, backfills) with batched executemany
+        
+        Args:
+            events: Iterable of AnalyticsEvent objects
+            chunk: Number of rows written per transaction
+        
+        Returns:
+            Number of events imported
+        """
+        self.flush()
+        imported = 0
+        rows = (self._event_row(event) for event in events)
+        with self._lock:
+            if self._conn is None:
+                return 0
+            with self._bulk_load_pragmas() as conn:
+                while True:
+                    batch = list(islice(rows, chunk))
+                    if not batch:
+                        break
+                    conn.execute("BEGIN")
+                    try:
+                        written = self._insert_batch(conn, EVENT_INSERT_SQL, batch)
+                        self._update_rollups(conn, written, [], [])
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                    imported += len(written)
+        return imported
+    
+    def latest_timestamp(self) -> int:
+        """Newest tracked epoch-ms timestamp, used as a cheap cache-bust key for dashboard queries"""
+        try:
+            self._flush_for_read()
+            with self._reader() as conn:
                 cursor = conn.execute("""
-                    SELECT COUNT(DISTINCT session_id) 
-                    FROM analytics_events 
-                    WHERE timestamp >= ? AND session_id != ''
-                """, (since_date,))
-                unique_sessions = cursor.fetchone()[0]
-                
-                return {
-                    "total_events": total_events,
-                    "events_by_type": events_by_type,
-                    "daily_activity": daily_activity,
-                    "unique_sessions": unique_sessions,
-                    "period_days": days
-                }
+                    SELECT MAX(ts) FROM (
+                        SELECT MAX(ts) AS ts FROM analytics_events
+                        UNION ALL
+                        SELECT MAX(ts) FROM performance_metrics
+                        UNION ALL
+                        SELECT MAX(ts) FROM document_engagement
+                    )
+                """)
+                return cursor.fetchone()[0] or 0
         except Exception:
-            return {
+            return 0
+    
+    def get_usage_stats(self, days: int = 30) -> Dict[str, Any]:
+        """Get usage statistics for the specified period"""
+        return self._query_sections(("usage_stats",), days)["usage_stats"]
+    
+    def get_document_analytics(self, days: int = 30) -> Dict[str, Any]:
+        """Get document engagement analytics"""
+        return self._query_sections(("document_analytics",), days)["document_analytics"]
+    
+    def get_performance_analytics(self, days: int = 30) -> Dict[str, Any]:
+        """Get performance analytics"""
+        return self._query_sections(("performance_analytics",), days)["performance_analytics"]
+    
+    def get_popular_queries(self, days: int = 30, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get most popular queries"""
+        return self._query_sections(("popular_queries",), days, query_limit=limit)["popular_queries"]
+    
+    def get_dashboard_bundle(self, days: int = 30, query_limit: int = 10) -> Dict[str, Any]:
+        """Get usage, document, performance and popular-query analytics in one round-trip"""
+        return self._query_sections(tuple(DASHBOARD_SECTION_SQL), days, query_limit)
+    
+    @staticmethod
+    def _summarize_performance(rows: List[tuple]) -> Dict[str, Any]:
+        """Fold (day, metric_type, sum_value, count, is_time) roll-up rows into averages and daily trends"""
+        totals: Dict[str, List[float]] = {}
+        performance_trends: Dict[str, Dict[str, float]] = {}
+        for day, metric_type, sum_value, count, is_time in rows:
+            if is_time:
+                acc = totals.setdefault(metric_type, [0.0, 0])
+                acc[0] += sum_value
+                acc[1] += count
+            performance_trends.setdefault(metric_type, {})[day] = round(sum_value / count, 3)
+        
+        avg_times = {
+            metric_type: {"avg": round(total / count, 3), "count": count}
+            for metric_type, (total, count) in totals.items()
+        }
+        return {
+            "avg_times": avg_times,
+            "performance_trends": {
+                metric_type: dict(sorted(trend.items()))
+                for metric_type, trend in performance_trends.items()
+            }
+        }
+    
+    def _query_sections(self, sections: Tuple[str, ...], days: int, query_limit: int = 10) -> Dict[str, Any]:
+        """Run the DASHBOARD_SECTION_SQL of the given sections as one statement and fold the tagged
+        rows into per-section results (sections not requested, or a failed query, stay empty)"""
+        bundle: Dict[str, Any] = {
+            "usage_stats": {
                 "total_events": 0,
                 "events_by_type": {},
                 "daily_activity": {},
                 "unique_sessions": 0,
                 "period_days": days
-            }
-    
-    def get_document_analytics(self, days: int = 30) -> Dict[str, Any]:
-        """Get document engagement analytics"""
-        try:
-            since_date = (datetime.now() - timedelta(days=days)).isoformat()
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # Most engaged documents
-                cursor = conn.execute("""
-                    SELECT document_name, COUNT(*) as engagement_count,
-                           AVG(relevance_score) as avg_relevance
-                    FROM document_engagement 
-                    WHERE timestamp >= ?
-                    GROUP BY document_name
-                    ORDER BY engagement_count DESC
-                    LIMIT 10
-                """, (since_date,))
-                top_documents = [
-                    {
-                        "document": row[0],
-                        "engagement_count": row[1],
-                        "avg_relevance": round(row[2], 3) if row[2] else 0
-                    }
-                    for row in cursor.fetchall()
-                ]
-                
-                # Engagement types
-                cursor = conn.execute("""
-                    SELECT engagement_type, COUNT(*) as count
-                    FROM document_engagement 
-                    WHERE timestamp >= ?
-                    GROUP BY engagement_type
-                """, (since_date,))
-                engagement_types = dict(cursor.fetchall())
-                
-                # Average relevance over time
-                cursor = conn.execute("""
-                    SELECT DATE(timestamp) as date, AVG(relevance_score) as avg_relevance
-                    FROM document_engagement 
-                    WHERE timestamp >= ? AND relevance_score > 0
-                    GROUP BY DATE(timestamp)
-                    ORDER BY date
-                """, (since_date,))
-                relevance_over_time = dict(cursor.fetchall())
-                
-                return {
-                    "top_documents": top_documents,
-                    "engagement_types": engagement_types,
-                    "relevance_over_time": relevance_over_time
-                }
-        except Exception:
-            return {
+            },
+            "document_analytics": {
                 "top_documents": [],
                 "engagement_types": {},
                 "relevance_over_time": {}
-            }
-    
-    def get_performance_analytics(self, days: int = 30) -> Dict[str, Any]:
-        """Get performance analytics"""
-        try:
-            since_date = (datetime.now() - timedelta(days=days)).isoformat()
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # Average response times
-                cursor = conn.execute("""
-                    SELECT metric_type, AVG(value) as avg_value, COUNT(*) as count
-                    FROM performance_metrics 
-                    WHERE timestamp >= ? AND metric_type LIKE '%_time'
-                    GROUP BY metric_type
-                """, (since_date,))
-                avg_times = {
-                    row[0]: {"avg": round(row[1], 3), "count": row[2]}
-                    for row in cursor.fetchall()
-                }
-                
-                # Performance trends
-                cursor = conn.execute("""
-                    SELECT DATE(timestamp) as date, metric_type, AVG(value) as avg_value
-                    FROM performance_metrics 
-                    WHERE timestamp >= ?
-                    GROUP BY DATE(timestamp), metric_type
-                    ORDER BY date
-                """, (since_date,))
-                
-                performance_trends = {}
-                for row in cursor.fetchall():
-                    date, metric_type, avg_value = row
-                    if metric_type not in performance_trends:
-                        performance_trends[metric_type] = {}
-                    performance_trends[metric_type][date] = round(avg_value, 3)
-                
-                return {
-                    "avg_times": avg_times,
-                    "performance_trends": performance_trends
-                }
-        except Exception:
-            return {
+            },
+            "performance_analytics": {
                 "avg_times": {},
                 "performance_trends": {}
-            }
-    
-    def get_popular_queries(self, days: int = 30, limit: int = 20) -> List[Dict[str, Any]]:
-        """Get most popular queries"""
+            },
+            "popular_queries": []
+        }
         try:
-            since_date = (datetime.now() - timedelta(days=days)).isoformat()
+            params = {
+                "since_day": (datetime.now() - timedelta(days=days)).date().isoformat(),
+                "since_ts": int((time.time() - days * 86400) * 1000),
+                "query_limit": query_limit
+            }
+            sql = "\nUNION ALL\n".join(part for section in sections for part in DASHBOARD_SECTION_SQL[section])
+            self._flush_for_read()  # make buffered rows visible to the read connection
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT 
-                        JSON_EXTRACT(metadata, '$.query') as query,
-                        COUNT(*) as frequency,
-                        AVG(CAST(JSON_EXTRACT(metadata, '$.response_length') AS REAL)) as avg_response_length
-                    FROM analytics_events 
-                    WHERE timestamp >= ? 
-                    AND event_type = 'query'
-                    AND JSON_EXTRACT(metadata, '$.query') IS NOT NULL
-                    GROUP BY JSON_EXTRACT(metadata, '$.query')
-                    ORDER BY frequency DESC
-                    LIMIT ?
-                """, (since_date, limit))
-                
-                return [
-                    {
-                        "query": row[0],
-                        "frequency": row[1],
-                        "avg_response_length": round(row[2], 1) if row[2] else 0
-                    }
-                    for row in cursor.fetchall()
-                ]
+            with self._reader() as conn:
+                rows = conn.execute(sql, params).fetchall()
         except Exception:
-            return []
+            return bundle
+        
+        usage = bundle["usage_stats"]
+        documents = bundle["document_analytics"]
+        performance_rows = []
+        for tag, key, sub_key, count, value in rows:
+            if tag == "event_type":
+                usage["events_by_type"][key] = count
+            elif tag == "daily":
+                usage["daily_activity"][key] = count
+            elif tag == "sessions":
+                usage["unique_sessions"] = count
+            elif tag == "document":
+                documents["top_documents"].append({
+                    "document": key,
+                    "engagement_count": count,
+                    "avg_relevance": round(value, 3) if value else 0
+                })
+            elif tag == "engagement_type":
+                documents["engagement_types"][key] = count
+            elif tag == "relevance":
+                documents["relevance_over_time"][key] = value
+            elif tag in ("performance", "performance_time"):
+                performance_rows.append((key, sub_key, value, count, tag == "performance_time"))
+            elif tag == "query":
+                bundle["popular_queries"].append({
+                    "query": key,
+                    "frequency": count,
+                    "avg_response_length": round(value, 1) if value else 0
+                })
+        
+        # UNION ALL does not guarantee branch ordering; apply the result orderings here
+        usage["events_by_type"] = dict(sorted(usage["events_by_type"].items(), key=lambda kv: kv[1], reverse=True))
+        usage["daily_activity"] = dict(sorted(usage["daily_activity"].items()))
+        usage["total_events"] = sum(usage["events_by_type"].values())
+        documents["top_documents"].sort(key=lambda d: d["engagement_count"], reverse=True)
+        documents["relevance_over_time"] = dict(sorted(documents["relevance_over_time"].items()))
+        bundle["performance_analytics"] = self._summarize_performance(performance_rows)
+        bundle["popular_queries"].sort(key=lambda q: q["frequency"], reverse=True)
+        return bundle
+    
+    def export_analytics_stream(self, days: int, out: BinaryIO) -> None:
+        """Write the analytics export as indented JSON to a binary file-like object, section by section"""
+        bundle = self.get_dashboard_bundle(days, query_limit=20)
+        sections = (
+            ("export_date", datetime.now().isoformat()),
+            ("period_days", days),
+            ("usage_stats", bundle["usage_stats"]),
+            ("document_analytics", bundle["document_analytics"]),
+            ("performance_analytics", bundle["performance_analytics"]),
+            ("popular_queries", bundle["popular_queries"])
+        )
+        out.write(b"{")
+        for i, (key, value) in enumerate(sections):
+            out.write(b',\n  "' if i else b'\n  "')
+            out.write(key.encode() + b'": ')
+            out.write(_dumps_export(value).replace(b"\n", b"\n  "))
+        out.write(b"\n}")
     
     def export_analytics(self, days: int = 30) -> str:
         """Export analytics data as JSON"""
         try:
-            data = {
-                "export_date": datetime.now().isoformat(),
-                "period_days": days,
-                "usage_stats": self.get_usage_stats(days),
-                "document_analytics": self.get_document_analytics(days),
-                "performance_analytics": self.get_performance_analytics(days),
-                "popular_queries": self.get_popular_queries(days)
-            }
-            
-            return json.dumps(data, indent=2, default=str)
+            buf = io.BytesIO()
+            self.export_analytics_stream(days, buf)
+            return buf.getvalue().decode("utf-8")
         except Exception as e:
             return json.dumps({"error": str(e)}, indent=2)
 
 
+# Cached dashboard queries. The leading-underscore tracker argument is not hashed by
+# Streamlit; results are keyed on (db_path, days, latest_ts) and expire after the TTL.
+DASHBOARD_CACHE_TTL_SECONDS = 30
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL_SECONDS, show_spinner=False)
+def _cached_dashboard_bundle(_analytics: AnalyticsTracker, db_path: str, days: int, query_limit: int, latest_ts: int) -> Dict[str, Any]:
+    return _analytics.get_dashboard_bundle(days, query_limit)
+
+
+def _arrow_frame(data: Any) -> pd.DataFrame:
+    """Build a DataFrame with pyarrow-backed dtypes when supported (pandas >= 2.0)"""
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    try:
+        return df.convert_dtypes(dtype_backend="pyarrow")
+    except (TypeError, ImportError):
+        return df
+
+
 def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30):
     """Create Plotly visualizations for analytics data"""
     
@@ -379,11 +878,13 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
         st.warning("📊 Plotly not installed. Install with: pip install plotly")
         st.info("Analytics data is still available in table format below.")
     
-    # Get data
-    usage_stats = analytics.get_usage_stats(days)
-    doc_analytics = analytics.get_document_analytics(days)
-    perf_analytics = analytics.get_performance_analytics(days)
-    popular_queries = analytics.get_popular_queries(days, 10)
+    # Get data (cached until new events arrive or the TTL expires)
+    latest_ts = analytics.latest_timestamp()
+    bundle = _cached_dashboard_bundle(analytics, analytics.db_path, days, 10, latest_ts)
+    usage_stats = bundle["usage_stats"]
+    doc_analytics = bundle["document_analytics"]
+    perf_analytics = bundle["performance_analytics"]
+    popular_queries = bundle["popular_queries"]
     
     st.markdown("### 📊 Usage Analytics")
     
@@ -398,11 +899,22 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
     with col4:
         st.metric("Event Types", len(usage_stats["events_by_type"]))
     
+    # Build Arrow-backed chart frames once from the result dicts
+    types_df = _arrow_frame({
+        "Event Type": list(usage_stats["events_by_type"]),
+        "Count": list(usage_stats["events_by_type"].values())
+    })
+    daily_df = _arrow_frame({
+        "Date": pd.to_datetime(list(usage_stats["daily_activity"])),
+        "Events": list(usage_stats["daily_activity"].values())
+    })
+    
     # Event types pie chart
     if usage_stats["events_by_type"] and PLOTLY_AVAILABLE:
         fig_pie = px.pie(
-            values=list(usage_stats["events_by_type"].values()),
-            names=list(usage_stats["events_by_type"].keys()),
+            types_df,
+            values="Count",
+            names="Event Type",
             title="Events by Type"
         )
         st.plotly_chart(fig_pie, use_container_width=True)
@@ -414,29 +926,22 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
     
     # Daily activity
     if usage_stats["daily_activity"] and PLOTLY_AVAILABLE:
-        dates = list(usage_stats["daily_activity"].keys())
-        counts = list(usage_stats["daily_activity"].values())
-        
         fig_line = px.line(
-            x=dates, y=counts,
+            daily_df, x="Date", y="Events",
             title="Daily Activity Trend",
-            labels={"x": "Date", "y": "Event Count"}
+            labels={"Events": "Event Count"}
         )
         st.plotly_chart(fig_line, use_container_width=True)
     elif usage_stats["daily_activity"]:
         # Fallback to table
         st.markdown("**Daily Activity:**")
-        daily_df = pd.DataFrame([
-            {"Date": date, "Events": count}
-            for date, count in usage_stats["daily_activity"].items()
-        ])
         st.dataframe(daily_df, use_container_width=True)
     
     # Document analytics
     st.markdown("### 📚 Document Analytics")
     
     if doc_analytics["top_documents"]:
-        doc_df = pd.DataFrame(doc_analytics["top_documents"])
+        doc_df = _arrow_frame(doc_analytics["top_documents"])
         
         # Top documents bar chart
         if PLOTLY_AVAILABLE:
@@ -458,10 +963,13 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
     if perf_analytics["avg_times"]:
         st.markdown("### ⚡ Performance Metrics")
         
-        perf_df = pd.DataFrame([
-            {"Metric": metric, "Average Time (s)": data["avg"], "Count": data["count"]}
-            for metric, data in perf_analytics["avg_times"].items()
-        ])
+        perf_df = (
+            pd.DataFrame.from_dict(perf_analytics["avg_times"], orient="index")
+            .rename(columns={"avg": "Average Time (s)", "count": "Count"})
+            .rename_axis("Metric")
+            .reset_index()
+            .pipe(_arrow_frame)
+        )
         
         col1, col2 = st.columns(2)
         with col1:
@@ -484,12 +992,12 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
     if popular_queries:
         st.markdown("### 🔍 Popular Queries")
         
-        queries_df = pd.DataFrame(popular_queries)
+        queries_df = _arrow_frame(popular_queries)
         
-        # Truncate long queries for display
-        queries_df["query_short"] = queries_df["query"].apply(
-            lambda x: x[:50] + "..." if len(x) > 50 else x
-        )
+        # Truncate long queries for display (vectorized string ops)
+        query_col = queries_df["query"]
+        truncated = query_col.str.slice(0, 50)
+        queries_df["query_short"] = truncated.where(query_col.str.len() <= 50, truncated + "...")
         
         if PLOTLY_AVAILABLE:
             fig_queries = px.bar(
@@ -511,6 +1019,10 @@ def create_analytics_visualizations(analytics: AnalyticsTracker, days: int = 30)
 
 @st.cache_resource
 def get_analytics_tracker() -> AnalyticsTracker:
-    """Get cached analytics tracker instance"""
+    """Get cached analytics tracker instance
+    
+    The cache is per process; when running several Streamlit workers set
+    ANALYTICS_DB_PATH to an absolute path so every worker opens the same file.
+    """
     db_path = os.getenv("ANALYTICS_DB_PATH", "analytics.db")
     return AnalyticsTracker(db_path)
\ No newline at end of file
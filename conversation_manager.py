@@ -3,15 +3,147 @@ Enhanced Conversation Memory System
 Provides persistent storage, categorization, search, and management of chat conversations
 """
 
+import csv
+import io
 import json
+import logging
 import os
 import sqlite3
 import hashlib
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
+import zlib
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, TextIO
 from dataclasses import dataclass, asdict
 import streamlit as st
 
+# Optional orjson for faster (de)serialization of stored messages
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+# Connection settings applied once to the long-lived connection: WAL lets listing reads
+# proceed while a save commits, and synchronous=NORMAL avoids an fsync per commit
+CONNECTION_PRAGMAS = """
+    PRAGMA auto_vacuum=INCREMENTAL;
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-64000;
+    PRAGMA busy_timeout=5000;
+"""
+
+# Soft-deleted conversations are purged once they are this old; the purge runs on a
+# background thread every COMPACT_INTERVAL_SECONDS
+PURGE_AFTER = "-1 day"
+COMPACT_INTERVAL_SECONDS = 3600
+
+# Explicit projections (never SELECT *): full rows for loading, metadata only for listings.
+# The _C selects are qualified for the listing queries, which alias conversations as c
+_CONV_COLS = "id, title, messages, created_at, updated_at, category, tags, summary, message_count, total_tokens"
+_CONV_LIST_COLS = (
+    "id, title, created_at, updated_at, category, tags, summary, message_count, total_tokens, "
+    "first_user_message, auto_category"
+)
+
+# Timestamp columns are tagged in the projection so sqlite3 (PARSE_COLNAMES) hands back
+# datetime objects; a private converter name leaves the global "timestamp" converter alone
+_DATETIME_CONVERTER = "conv_datetime"
+sqlite3.register_converter(_DATETIME_CONVERTER, lambda value: datetime.fromisoformat(value.decode()))
+
+
+def _projection(columns: str, alias: str = "") -> str:
+    """SELECT list for the given columns, optionally qualified, with timestamp columns typed"""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(
+        f'{prefix}{col} AS "{col} [{_DATETIME_CONVERTER}]"' if col in ("created_at", "updated_at")
+        else f"{prefix}{col}"
+        for col in columns.split(", ")
+    )
+
+
+_CONV_SELECT = _projection(_CONV_COLS)
+_CONV_SELECT_C = _projection(_CONV_COLS, "c")
+_CONV_LIST_SELECT_C = _projection(_CONV_LIST_COLS, "c")
+
+# Stored messages at or above this many bytes of JSON are zlib-compressed
+MESSAGES_COMPRESS_THRESHOLD = 4096
+
+# Upsert rather than INSERT OR REPLACE: REPLACE's implicit delete skips the
+# delete trigger, which would leave stale rows in the search index
+SAVE_CONVERSATION_SQL = """
+    INSERT INTO conversations 
+    (id, title, messages, created_at, updated_at, category, tags, summary, message_count, total_tokens,
+     first_user_message, auto_category)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title,
+        messages = excluded.messages,
+        created_at = excluded.created_at,
+        updated_at = excluded.updated_at,
+        category = excluded.category,
+        tags = excluded.tags,
+        summary = excluded.summary,
+        message_count = excluded.message_count,
+        total_tokens = excluded.total_tokens,
+        first_user_message = excluded.first_user_message,
+        auto_category = excluded.auto_category,
+        deleted_at = NULL
+"""
+
+# Search-term tokens become quoted FTS5 prefix terms, so user input is never parsed as query syntax
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _dumps(value: Any) -> str:
+    """JSON text for a stored column"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(value).decode()
+        except TypeError:
+            pass  # e.g. non-str keys; stdlib handles these
+    return json.dumps(value)
+
+
+def _loads(value: str) -> Any:
+    """Parse a stored JSON column"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
+def _dumps_messages(messages: List[Dict[str, Any]]) -> bytes:
+    """Messages as a JSON BLOB, zlib-compressed once it is large enough to be worth it"""
+    if ORJSON_AVAILABLE:
+        try:
+            raw = orjson.dumps(messages)
+        except TypeError:
+            raw = json.dumps(messages).encode()
+    else:
+        raw = json.dumps(messages).encode()
+    if len(raw) >= MESSAGES_COMPRESS_THRESHOLD:
+        return zlib.compress(raw, 1)
+    return raw
+
+
+def _loads_messages(value: Any) -> List[Dict[str, Any]]:
+    """Parse the messages column: legacy JSON TEXT, JSON BLOB, or zlib-compressed JSON BLOB"""
+    if isinstance(value, str):
+        return _loads(value)
+    if value[:1] == b"x":  # zlib header; JSON text never starts with 'x'
+        value = zlib.decompress(value)
+    return _loads(value)
+
 
 @dataclass
 class Conversation:
@@ -34,16 +166,77 @@ class Conversation:
             self.message_count = len(self.messages)
 
 
+@dataclass
+class ConversationSummary:
+    """Conversation metadata for listings, without the messages payload"""
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    category: str = "general"
+    tags: Optional[List[str]] = None
+    summary: str = ""
+    message_count: int = 0
+    total_tokens: int = 0
+    first_user_message: str = ""
+    auto_category: str = "general"
+
+
 class ConversationManager:
     """Manages conversation storage, retrieval, and organization"""
     
     def __init__(self, db_path: str = "conversations.db"):
         self.db_path = db_path
+        # One long-lived connection keeps SQLite's page cache warm across Streamlit reruns;
+        # the cached manager is shared by all sessions, so calls serialize on a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None,
+            detect_types=sqlite3.PARSE_COLNAMES
+        )
+        self._conn.row_factory = sqlite3.Row
         self._init_database()
+        
+        # Deletes only mark rows; this thread purges them and returns pages to the OS
+        self._closed = threading.Event()
+        self._compactor = threading.Thread(target=self._compact_loop, name="conversation-compactor", daemon=True)
+        self._compactor.start()
+        
+        # Single worker keeps background saves in submission order
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-save")
+    
+    def close(self):
+        """Finish pending saves, stop background compaction and close the underlying database connection"""
+        self._closed.set()
+        self._save_executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+    
+    def _compact_loop(self):
+        """Background thread: periodically purge soft-deleted conversations"""
+        while not self._closed.wait(COMPACT_INTERVAL_SECONDS):
+            try:
+                self.compact()
+            except Exception:
+                pass  # retried next interval
+    
+    def compact(self) -> int:
+        """Permanently remove conversations soft-deleted before PURGE_AFTER; returns rows purged"""
+        with self._lock:
+            conn = self._conn
+            cursor = conn.execute(
+                "DELETE FROM conversations WHERE deleted_at < datetime('now', ?)",
+                (PURGE_AFTER,)
+            )
+            # Only frees pages in databases created with auto_vacuum=INCREMENTAL; a no-op otherwise
+            conn.execute("PRAGMA incremental_vacuum")
+            return cursor.rowcount
     
     def _init_database(self):
         """Initialize the SQLite database for conversation storage"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            conn = self._conn
+            conn.executescript(CONNECTION_PRAGMAS)
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS conversations (
                     id TEXT PRIMARY KEY,
@@ -64,121 +257,275 @@ class ConversationManager:
                 ON conversations(created_at)
             """)
             
+            # Listing order is (updated_at DESC, id DESC); these indexes serve it directly, with
+            # or without a category filter, so keyset pages are a seek rather than a sort
+            conn.execute("DROP INDEX IF EXISTS idx_conversations_category")
+            conn.execute("DROP INDEX IF EXISTS idx_conversations_updated_at")
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_category 
-                ON conversations(category)
+                CREATE INDEX IF NOT EXISTS idx_conv_cat_updated 
+                ON conversations(category, updated_at DESC, id DESC)
             """)
             
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_updated_at 
-                ON conversations(updated_at)
+                CREATE INDEX IF NOT EXISTS idx_conv_updated 
+                ON conversations(updated_at DESC, id DESC)
+            """)
+            
+            self._add_column(conn, "deleted_at TEXT")
+            
+            # Derived once per save so listings never re-scan the messages
+            added_first = self._add_column(conn, "first_user_message TEXT DEFAULT ''")
+            added_auto = self._add_column(conn, "auto_category TEXT DEFAULT 'general'")
+            if added_first or added_auto:
+                rows = conn.execute("SELECT rowid, messages FROM conversations").fetchall()
+                backfill = []
+                for rowid, messages_json in rows:
+                    messages = _loads_messages(messages_json)
+                    backfill.append((first_user_message(messages), auto_categorize_conversation(messages), rowid))
+                conn.executemany(
+                    "UPDATE conversations SET first_user_message = ?, auto_category = ? WHERE rowid = ?",
+                    backfill
+                )
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_conversations_auto_category 
+                ON conversations(auto_category)
+            """)
+            
+            self._fts_enabled = self._init_search_index(conn)
+    
+    @staticmethod
+    def _add_column(conn: sqlite3.Connection, column_ddl: str) -> bool:
+        """Add a column to conversations if it is missing; returns True when it was added"""
+        try:
+            conn.execute(f"ALTER TABLE conversations ADD COLUMN {column_ddl}")
+            return True
+        except sqlite3.OperationalError as e:
+            if "duplicate column" in str(e).lower():
+                return False
+            raise
+    
+    @staticmethod
+    def _init_search_index(conn: sqlite3.Connection) -> bool:
+        """Create the FTS5 index over title/summary; returns False when FTS5 is not compiled in"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE conversations_fts USING fts5(
+                    title, summary,
+                    content='conversations', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
             """)
+        except sqlite3.OperationalError:
+            return False  # search falls back to LIKE
+        
+        # External-content table: triggers keep the index in step with the conversations rows
+        conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+                INSERT INTO conversations_fts(rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+                INSERT INTO conversations_fts(conversations_fts, rowid, title, summary)
+                VALUES ('delete', old.rowid, old.title, old.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE ON conversations BEGIN
+                INSERT INTO conversations_fts(conversations_fts, rowid, title, summary)
+                VALUES ('delete', old.rowid, old.title, old.summary);
+                INSERT INTO conversations_fts(rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+            END;
+        """)
+        conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+        return True
+    
+    @staticmethod
+    def _conversation_row(conversation: Conversation) -> tuple:
+        """Parameter tuple for SAVE_CONVERSATION_SQL"""
+        return (
+            conversation.id,
+            conversation.title,
+            _dumps_messages(conversation.messages),
+            conversation.created_at.isoformat(),
+            conversation.updated_at.isoformat(),
+            conversation.category,
+            _dumps(conversation.tags),
+            conversation.summary,
+            conversation.message_count,
+            conversation.total_tokens,
+            first_user_message(conversation.messages),
+            auto_categorize_conversation(conversation.messages)
+        )
+    
+    def _write_conversation(self, conversation: Conversation) -> None:
+        """Upsert a conversation row; raises on failure"""
+        with self._lock:
+            self._conn.execute(SAVE_CONVERSATION_SQL, self._conversation_row(conversation))
     
     def save_conversation(self, conversation: Conversation) -> bool:
         """Save or update a conversation in the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO conversations 
-                    (id, title, messages, created_at, updated_at, category, tags, summary, message_count, total_tokens)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    conversation.id,
-                    conversation.title,
-                    json.dumps(conversation.messages),
-                    conversation.created_at.isoformat(),
-                    conversation.updated_at.isoformat(),
-                    conversation.category,
-                    json.dumps(conversation.tags),
-                    conversation.summary,
-                    conversation.message_count,
-                    conversation.total_tokens
-                ))
+            self._write_conversation(conversation)
             return True
         except Exception as e:
             st.error(f"Failed to save conversation: {e}")
             return False
     
+    @staticmethod
+    def _row_to_conversation(row: sqlite3.Row) -> Conversation:
+        """Build a Conversation from a row selected with _CONV_COLS"""
+        return Conversation(
+            id=row["id"],
+            title=row["title"],
+            messages=_loads_messages(row["messages"]),
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            category=row["category"],
+            tags=_loads(row["tags"]),
+            summary=row["summary"],
+            message_count=row["message_count"],
+            total_tokens=row["total_tokens"]
+        )
+    
+    def save_conversation_async(self, conversation: Conversation) -> Future:
+        """
+        Save a conversation on the background writer so the script thread does not wait on SQLite
+        
+        The worker has no Streamlit script context, so failures are logged and left on the
+        returned Future (its result() re-raises them) rather than reported with st.error.
+        """
+        future = self._save_executor.submit(self._write_conversation, conversation)
+        future.add_done_callback(self._log_save_failure)
+        return future
+    
+    @staticmethod
+    def _log_save_failure(future: Future) -> None:
+        """Done-callback for background saves"""
+        error = future.exception()
+        if error is not None:
+            logger.error("Background conversation save failed: %s", error)
+    
     def load_conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Load a specific conversation by ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._lock:
+                conn = self._conn
                 cursor = conn.execute(
-                    "SELECT * FROM conversations WHERE id = ?", 
+                    f"SELECT {_CONV_SELECT} FROM conversations WHERE id = ? AND deleted_at IS NULL", 
                     (conversation_id,)
                 )
                 row = cursor.fetchone()
                 
                 if row:
-                    return Conversation(
-                        id=row[0],
-                        title=row[1],
-                        messages=json.loads(row[2]),
-                        created_at=datetime.fromisoformat(row[3]),
-                        updated_at=datetime.fromisoformat(row[4]),
-                        category=row[5],
-                        tags=json.loads(row[6]),
-                        summary=row[7],
-                        message_count=row[8],
-                        total_tokens=row[9]
-                    )
+                    return self._row_to_conversation(row)
         except Exception as e:
             st.error(f"Failed to load conversation: {e}")
         return None
     
+    def _filter_clause(
+        self,
+        category: Optional[str],
+        search_term: str,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> Tuple[str, List[Any], str]:
+        """FROM/WHERE clause, parameters and ordering shared by the listing queries (rows aliased as c)"""
+        source = " FROM conversations c"
+        clause = " WHERE c.deleted_at IS NULL"
+        params: List[Any] = []
+        order_by = "c.updated_at DESC, c.id DESC"
+        
+        if category:
+            clause += " AND c.category = ?"
+            params.append(category)
+        
+        if search_term:
+            tokens = _FTS_TOKEN_RE.findall(search_term)
+            if self._fts_enabled and tokens:
+                source = " FROM conversations_fts f JOIN conversations c ON c.rowid = f.rowid"
+                clause += " AND conversations_fts MATCH ?"
+                params.append(" ".join(f'"{token}"*' for token in tokens))
+                order_by = "bm25(conversations_fts), c.updated_at DESC"
+            else:
+                clause += " AND (c.title LIKE ? OR c.summary LIKE ?)"
+                search_pattern = f"%{search_term}%"
+                params.extend([search_pattern, search_pattern])
+        
+        # Keyset pagination: continue after the last row of the previous page (recency order only)
+        if after is not None:
+            if not order_by.startswith("c.updated_at"):
+                raise ValueError("after= paging is not supported for relevance-ranked (FTS) search; use offset")
+            clause += " AND (c.updated_at, c.id) < (?, ?)"
+            params.extend([after[0].isoformat(), after[1]])
+        
+        return source + clause, params, order_by
+    
     def list_conversations(
         self, 
         category: Optional[str] = None,
         limit: int = 50,
         offset: int = 0,
-        search_term: str = ""
-    ) -> List[Conversation]:
-        """List conversations with optional filtering"""
+        search_term: str = "",
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[ConversationSummary]:
+        """
+        List conversations with optional filtering (metadata only; use load_conversation for messages)
+        
+        Pass ``after=(last.updated_at, last.id)`` from the previous page to page without OFFSET.
+        Searches answered by the FTS index are ordered by relevance, not recency, so they page
+        with ``offset`` only; combining them with ``after`` raises ValueError.
+        """
+        clause, params, order_by = self._filter_clause(category, search_term, after)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                query = "SELECT * FROM conversations WHERE 1=1"
-                params = []
-                
-                if category:
-                    query += " AND category = ?"
-                    params.append(category)
-                
-                if search_term:
-                    query += " AND (title LIKE ? OR summary LIKE ?)"
-                    search_pattern = f"%{search_term}%"
-                    params.extend([search_pattern, search_pattern])
-                
-                query += " ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+            with self._lock:
+                conn = self._conn
+                query = f"SELECT {_CONV_LIST_SELECT_C}{clause} ORDER BY {order_by} LIMIT ? OFFSET ?"
                 params.extend([limit, offset])
                 
                 cursor = conn.execute(query, params)
                 rows = cursor.fetchall()
                 
-                conversations = []
-                for row in rows:
-                    conversations.append(Conversation(
-                        id=row[0],
-                        title=row[1],
-                        messages=json.loads(row[2]),
-                        created_at=datetime.fromisoformat(row[3]),
-                        updated_at=datetime.fromisoformat(row[4]),
-                        category=row[5],
-                        tags=json.loads(row[6]),
-                        summary=row[7],
-                        message_count=row[8],
-                        total_tokens=row[9]
-                    ))
-                
-                return conversations
+                return [
+                    ConversationSummary(
+                        id=row["id"],
+                        title=row["title"],
+                        created_at=row["created_at"],
+                        updated_at=row["updated_at"],
+                        category=row["category"],
+                        tags=_loads(row["tags"]),
+                        summary=row["summary"],
+                        message_count=row["message_count"],
+                        total_tokens=row["total_tokens"],
+                        first_user_message=row["first_user_message"] or "",
+                        auto_category=row["auto_category"] or "general"
+                    )
+                    for row in rows
+                ]
         except Exception as e:
             st.error(f"Failed to list conversations: {e}")
             return []
     
+    def _list_full_conversations(self, category: Optional[str] = None, limit: int = 1000) -> List[Conversation]:
+        """List conversations including their messages (used by the JSON export)"""
+        with self._lock:
+            conn = self._conn
+            clause, params, order_by = self._filter_clause(category, "")
+            query = f"SELECT {_CONV_SELECT_C}{clause} ORDER BY {order_by} LIMIT ?"
+            params.append(limit)
+            rows = conn.execute(query, params).fetchall()
+        
+        return [self._row_to_conversation(row) for row in rows]
+    
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation by ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            with self._lock:
+                conn = self._conn
+                conn.execute(
+                    "UPDATE conversations SET deleted_at = datetime('now') WHERE id = ? AND deleted_at IS NULL",
+                    (conversation_id,)
+                )
             return True
         except Exception as e:
             st.error(f"Failed to delete conversation: {e}")
@@ -187,8 +534,9 @@ class ConversationManager:
     def get_categories(self) -> List[str]:
         """Get all unique categories"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("SELECT DISTINCT category FROM conversations ORDER BY category")
+            with self._lock:
+                conn = self._conn
+                cursor = conn.execute("SELECT DISTINCT category FROM conversations WHERE deleted_at IS NULL ORDER BY category")
                 return [row[0] for row in cursor.fetchall()]
         except Exception:
             return ["general"]
@@ -196,7 +544,8 @@ class ConversationManager:
     def get_conversation_stats(self) -> Dict[str, Any]:
         """Get conversation statistics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._lock:
+                conn = self._conn
                 cursor = conn.execute("""
                     SELECT 
                         COUNT(*) as total_conversations,
@@ -205,6 +554,7 @@ class ConversationManager:
                         AVG(message_count) as avg_messages_per_conversation,
                         COUNT(DISTINCT category) as total_categories
                     FROM conversations
+                    WHERE deleted_at IS NULL
                 """)
                 row = cursor.fetchone()
                 
@@ -233,9 +583,8 @@ class ConversationManager:
         category: Optional[str] = None
     ) -> str:
         """Export conversations in specified format"""
-        conversations = self.list_conversations(category=category, limit=1000)
-        
         if format_type == "json":
+            conversations = self._list_full_conversations(category=category, limit=1000)
             export_data = {
                 "export_date": datetime.now().isoformat(),
                 "total_conversations": len(conversations),
@@ -244,36 +593,44 @@ class ConversationManager:
             return json.dumps(export_data, indent=2, default=str)
         
         elif format_type == "csv":
-            import csv
-            import io
-            
             output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow([
-                "ID", "Title", "Category", "Created", "Updated", 
-                "Message Count", "Total Tokens", "Summary"
-            ])
-            
-            # Write data
-            for conv in conversations:
-                writer.writerow([
-                    conv.id,
-                    conv.title,
-                    conv.category,
-                    conv.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    conv.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    conv.message_count,
-                    conv.total_tokens,
-                    conv.summary
-                ])
-            
+            self.export_conversations_csv_stream(output, category=category)
             return output.getvalue()
         
         else:
             raise ValueError(f"Unsupported export format: {format_type}")
     
+    def export_conversations_csv_stream(
+        self,
+        out: TextIO,
+        category: Optional[str] = None,
+        limit: int = 1000
+    ) -> None:
+        """Write the CSV export to a text file-like object, paging rows straight from the cursor"""
+        writer = csv.writer(out)
+        
+        # Write header
+        writer.writerow([
+            "ID", "Title", "Category", "Created", "Updated", 
+            "Message Count", "Total Tokens", "Summary"
+        ])
+        
+        # Write data; timestamps are ISO strings, trimmed to 'YYYY-MM-DD HH:MM:SS' in SQL
+        with self._lock:
+            clause, params, order_by = self._filter_clause(category, "")
+            cursor = self._conn.execute(f"""
+                SELECT c.id, c.title, c.category,
+                       replace(substr(c.created_at, 1, 19), 'T', ' '),
+                       replace(substr(c.updated_at, 1, 19), 'T', ' '),
+                       c.message_count, c.total_tokens, c.summary{clause}
+                ORDER BY {order_by} LIMIT ?
+            """, params + [limit])
+            while True:
+                rows = cursor.fetchmany(100)
+                if not rows:
+                    break
+                writer.writerows(rows)
+    
     def import_conversations(self, import_data: str, format_type: str = "json") -> Tuple[int, int]:
         """Import conversations from exported data"""
         imported = 0
@@ -281,22 +638,31 @@ class ConversationManager:
         
         try:
             if format_type == "json":
-                data = json.loads(import_data)
+                data = _loads(import_data)
                 conversations_data = data.get("conversations", [])
                 
+                rows = []
                 for conv_data in conversations_data:
                     try:
                         # Convert string dates back to datetime
                         conv_data["created_at"] = datetime.fromisoformat(conv_data["created_at"])
                         conv_data["updated_at"] = datetime.fromisoformat(conv_data["updated_at"])
                         
-                        conv = Conversation(**conv_data)
-                        if self.save_conversation(conv):
-                            imported += 1
-                        else:
-                            errors += 1
+                        rows.append(self._conversation_row(Conversation(**conv_data)))
                     except Exception:
                         errors += 1
+                
+                # One transaction for the whole import instead of a commit per conversation
+                with self._lock:
+                    conn = self._conn
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        conn.executemany(SAVE_CONVERSATION_SQL, rows)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                imported = len(rows)
             
         except Exception as e:
             st.error(f"Import failed: {e}")
@@ -307,14 +673,22 @@ class ConversationManager:
 
 def generate_conversation_id(messages: List[Dict[str, Any]]) -> str:
     """Generate a unique conversation ID based on content"""
-    if not messages:
-        return hashlib.md5(str(datetime.now().timestamp()).encode()).hexdigest()[:12]
+    # 6-byte BLAKE2b digest -> 12 hex chars, same shape as before; BLAKE2 is faster
+    # than MD5 and still available when OpenSSL runs in FIPS mode
+    content_hash = hashlib.blake2b(time.time_ns().to_bytes(8, "little"), digest_size=6)
     
     # Use first message content and timestamp for ID generation
-    first_msg = messages[0].get("content", "")
-    timestamp = str(datetime.now().timestamp())
-    content_hash = hashlib.md5(f"{first_msg}_{timestamp}".encode()).hexdigest()
-    return content_hash[:12]
+    if messages:
+        content_hash.update(messages[0].get("content", "").encode())
+    return content_hash.hexdigest()
+
+
+def first_user_message(messages: List[Dict[str, Any]]) -> str:
+    """Content of the first user message, or an empty string"""
+    for msg in messages:
+        if msg.get("role") == "user":
+            return msg.get("content", "")
+    return ""
 
 
 def generate_conversation_title(messages: List[Dict[str, Any]]) -> str:
@@ -322,12 +696,7 @@ def generate_conversation_title(messages: List[Dict[str, Any]]) -> str:
     if not messages:
         return "New Conversation"
     
-    # Find first user message
-    first_user_msg = None
-    for msg in messages:
-        if msg.get("role") == "user":
-            first_user_msg = msg.get("content", "")
-            break
+    first_user_msg = first_user_message(messages)
     
     if not first_user_msg:
         return "New Conversation"
@@ -343,33 +712,47 @@ def generate_conversation_title(messages: List[Dict[str, Any]]) -> str:
     return title if title else "New Conversation"
 
 
+# Simple keyword-based categorization, in priority order
+CATEGORY_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("technical", ("code", "programming", "debug", "error", "function", "api", "database")),
+    ("research", ("analyze", "research", "study", "compare", "explain", "what is")),
+    ("creative", ("write", "create", "design", "generate", "story", "poem")),
+    ("business", ("strategy", "plan", "market", "sales", "revenue", "business")),
+    ("educational", ("learn", "teach", "tutorial", "example", "how to", "guide")),
+    ("support", ("help", "issue", "problem", "fix", "broken", "not working"))
+)
+_CATEGORY_NAMES = tuple(name for name, _ in CATEGORY_KEYWORDS)
+_KEYWORD_PRIORITY: Dict[str, int] = {}
+for _priority, (_, _keywords) in enumerate(CATEGORY_KEYWORDS):
+    for _keyword in _keywords:
+        _KEYWORD_PRIORITY.setdefault(_keyword, _priority)
+# Zero-width lookahead reports overlapping hits (e.g. "plan" inside "explain"), and the
+# alternation is in priority order, so each position yields its best category
+_CATEGORY_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(keyword) for keyword in _KEYWORD_PRIORITY) + "))"
+)
+
+
 def auto_categorize_conversation(messages: List[Dict[str, Any]]) -> str:
     """Automatically categorize conversation based on content"""
     if not messages:
         return "general"
     
-    # Combine all message content for analysis
+    # Combine all message content for analysis, lower-casing once
     all_content = " ".join([
-        msg.get("content", "").lower() 
+        msg.get("content", "")
         for msg in messages 
         if msg.get("role") == "user"
-    ])
-    
-    # Simple keyword-based categorization
-    categories = {
-        "technical": ["code", "programming", "debug", "error", "function", "api", "database"],
-        "research": ["analyze", "research", "study", "compare", "explain", "what is"],
-        "creative": ["write", "create", "design", "generate", "story", "poem"],
-        "business": ["strategy", "plan", "market", "sales", "revenue", "business"],
-        "educational": ["learn", "teach", "tutorial", "example", "how to", "guide"],
-        "support": ["help", "issue", "problem", "fix", "broken", "not working"]
-    }
-    
-    for category, keywords in categories.items():
-        if any(keyword in all_content for keyword in keywords):
-            return category
-    
-    return "general"
+    ]).lower()
+    
+    # One C-level scan; the earliest-listed category with any keyword hit wins
+    best = len(_CATEGORY_NAMES)
+    for match in _CATEGORY_PATTERN.finditer(all_content):
+        best = min(best, _KEYWORD_PRIORITY[match.group(1)])
+        if best == 0:
+            break
+    
+    return _CATEGORY_NAMES[best] if best < len(_CATEGORY_NAMES) else "general"
 
 
 @st.cache_resource
@@ -7,13 +7,26 @@ import streamlit as st
 from google import genai
 import os
 import time
+import hashlib
+import io
+import re
+import uuid
 import json  # for exporting sources as JSON
+import math
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import Callable, List, Dict, Any, Optional
+
+try:
+    import xxhash  # optional: much faster chunk hashing for duplicate filtering
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
 
 # Import our custom modules
 from document_processor import DocumentProcessor, create_document_processor
-from vector_database import VectorDatabase  # Removed missing get_vector_database (and unused display_vector_db_info)
+from vector_database import VectorDatabase, SemanticResponseCache  # Removed missing get_vector_database (and unused display_vector_db_info)
 from conversation_manager import (
     ConversationManager, Conversation, get_conversation_manager,
     generate_conversation_id, generate_conversation_title, auto_categorize_conversation
@@ -43,10 +56,210 @@ def get_vector_database(collection_name: str = "rag_chatbot_docs"):
             # Last-resort no-arg construction
             return VectorDatabase()
 
+@st.cache_resource(show_spinner=False)
+def get_genai_client(api_key: str):
+    """Cached Google AI client, one per API key for the whole process"""
+    return genai.Client(api_key=api_key)
+
+def _semantic_cache() -> SemanticResponseCache:
+    """This session's answer cache for near-duplicate queries (entries keyed by document-set version).
+    Kept per session: answers are never served across users."""
+    if "_semantic_cache" not in st.session_state:
+        st.session_state._semantic_cache = SemanticResponseCache(threshold=0.92, capacity=128)
+    return st.session_state._semantic_cache
+
+@st.cache_resource
+def _persisted_chunk_hashes(_vector_db, collection_name: str) -> Dict[str, Any]:
+    """Process-wide chunk hashes known to be stored in the collection, with the database version they match"""
+    return {"version": None, "hashes": set()}
+
+@st.cache_resource(ttl=3600)
+def _dead_models(api_key_hash: str) -> set:
+    """Model names the API reported as not found for this API key; skipped by get_chat_for_model for an hour"""
+    return set()
+
+def _is_model_unavailable(err: Exception) -> bool:
+    """True if a chat-creation error means the model itself does not exist (HTTP 404 / NOT_FOUND)"""
+    if getattr(err, "code", None) == 404 or str(getattr(err, "status", "")).upper() == "NOT_FOUND":
+        return True
+    message = str(err).lower()
+    return "not found" in message or "404" in message
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _list_gemini_models(api_key_hash: str, _client) -> List[str]:
+    """
+    Raw model names from the Google AI models endpoint, shared across sessions.
+
+    Keyed by a hash of the API key (never the key itself) and refreshed every 10 minutes;
+    failures raise and are therefore not cached.
+    """
+    return [getattr(m, "name", "") or "" for m in _client.models.list()]  # type: ignore[attr-defined]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_collection_info(_vector_db, collection_name: str, version: int) -> Dict[str, Any]:
+    """Collection info for the sidebar/status cards; re-read after an add/clear, or every minute
+    to pick up writes from other processes sharing the persist directory"""
+    return _vector_db.get_collection_info()
+
+def get_collection_info(vector_db) -> Dict[str, Any]:
+    """Cached get_collection_info keyed on the database's change counter"""
+    return _cached_collection_info(vector_db, vector_db.collection_name, getattr(vector_db, "version", 0))
+
+def _kb_has_docs(vector_db) -> bool:
+    """Whether the knowledge base holds any chunks; probed once per database version per session"""
+    version = getattr(vector_db, "version", 0)
+    known = st.session_state.get("_kb_has_docs")
+    if known is None or known[0] != version:
+        known = (version, get_collection_info(vector_db).get("document_count", 0) > 0)
+        st.session_state._kb_has_docs = known
+    return known[1]
+
+# Per-session LRU of retrieval results for repeated queries, with a TTL on each entry
+_RETRIEVAL_CACHE_SIZE = 128
+_RETRIEVAL_CACHE_TTL = 300.0
+
+def _retrieval_cache_key(query: str, version: int, use_rag: bool, n_results: int, max_context_length: int) -> tuple:
+    """Key for a query (case and whitespace normalized) under a document-set version and RAG settings"""
+    digest = hashlib.blake2b(" ".join(query.lower().split()).encode("utf-8"), digest_size=16).hexdigest()
+    return (version, digest, use_rag, n_results, max_context_length)
+
+def _retrieval_cache_get(key: tuple):
+    """Cached (query embedding, search results, context) for key, or None if absent or expired"""
+    cache = st.session_state.get("_retrieval_cache")
+    entry = cache.get(key) if cache else None
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > _RETRIEVAL_CACHE_TTL:
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return entry[1]
+
+def _retrieval_cache_put(key: tuple, value: tuple) -> None:
+    """Store a retrieval result, evicting the least recently used entries beyond the size limit"""
+    cache = st.session_state.setdefault("_retrieval_cache", OrderedDict())
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+    while len(cache) > _RETRIEVAL_CACHE_SIZE:
+        cache.popitem(last=False)
+
+# Environment configuration, read once at import
+_ENV_GEMINI_MODEL = os.getenv("GEMINI_DEFAULT_MODEL")
+_ENV_DEFAULT_MODEL = _ENV_GEMINI_MODEL or os.getenv("DEFAULT_MODEL")  # legacy alias DEFAULT_MODEL
+_ENV_EMBED = os.getenv("EMBED_MODE", "").lower() in {"1", "true", "yes"}
+_CHAT_MESSAGE_LIMIT = int(os.getenv("CHAT_MESSAGE_LIMIT", "50"))
+
+# Query-param accessor, resolved once: st.query_params on current Streamlit, the
+# experimental getter (which returns lists of values) on older releases
+if hasattr(st, "query_params"):
+    def _query_params_get():
+        return st.query_params
+else:
+    _query_params_get = st.experimental_get_query_params
+
+# Recent Streamlit accepts a callable for download_button(data=...) and only runs it when the
+# button is clicked; older releases need the content up front
+_DEFERRED_DOWNLOADS = "callable" in (st.download_button.__doc__ or "")
+
+def _download_data(build: Callable[[], str]):
+    """download_button data: the builder itself where deferred downloads are supported, else its result"""
+    return build if _DEFERRED_DOWNLOADS else build()
+
+def _chunk_hash(text: str) -> str:
+    """Content hash used to skip duplicate chunks (xxh3-64 when available, else SHA-1)"""
+    data = text.encode('utf-8', errors='ignore')
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.sha1(data).hexdigest()
+
+@st.cache_resource(show_spinner=False)
+def _token_encoder():
+    """tiktoken encoder for precise token counting, built once per process (None when unavailable)"""
+    try:
+        import tiktoken as _tiktoken  # optional precise token counting
+        return _tiktoken.get_encoding("cl100k_base")
+    except Exception:  # noqa
+        return None
+
+@lru_cache(maxsize=1024)
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoder = _token_encoder()
+    if encoder is not None:
+        try:
+            return len(encoder.encode(text))
+        except Exception:
+            pass
+    return max(1, math.ceil(len(text) / 4))  # fallback heuristic
+
+def _message_tokens(msg: Dict[str, Any]) -> int:
+    """Token estimate stored on the message (computed once, e.g. for loaded history)"""
+    tokens = msg.get("tokens")
+    if tokens is None:
+        tokens = msg["tokens"] = estimate_tokens(msg.get("content") or "")
+    return tokens
+
+def _token_estimate_total() -> int:
+    """Estimated tokens of the current history, summed from the per-message counts"""
+    return sum(_message_tokens(m) for m in st.session_state.get("messages", []))
+
+# Icon shown per uploaded file MIME type
+_FILE_ICONS = {
+    "application/pdf": "📕",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "📘",
+    "text/plain": "📄",
+}
+
+# HTML templates filled with str.format_map on render
+_FILE_CARD_TEMPLATE = """<div class="modern-card" style="margin: 0.5rem 0; padding: 1rem;">
+    <div style="display: flex; justify-content: space-between; align-items: center;">
+        <div style="display: flex; align-items: center; gap: 1rem;">
+            <div style="font-size: 1.5rem;">
+                {icon}
+            </div>
+            <div>
+                <div style="font-weight: 500; color: var(--text-primary);">{name}</div>
+                <div style="font-size: 0.875rem; color: var(--text-secondary);">{size} • {type}</div>
+            </div>
+        </div>
+        <div class="status-badge status-success">Ready</div>
+    </div>
+</div>"""
+
+_KB_STATUS_TEMPLATE = """<div class="modern-card" style="background: linear-gradient(135deg, var(--accent-color), var(--primary-color)); color: white;">
+    <div style="display: flex; justify-content: space-between; align-items: center;">
+        <div>
+            <div style="font-size: 1.25rem; font-weight: 600;">Knowledge Base Active</div>
+            <div style="opacity: 0.9; font-size: 0.875rem;">{doc_count} documents ready for queries</div>
+        </div>
+        <div style="font-size: 2rem;">🧠</div>
+    </div>
+</div>"""
+
+_QUICK_STATS_TEMPLATE = (
+    "<div class='modern-card' style='padding:0.75rem; font-size:0.75rem; line-height:1.4;'>"
+    "🧠 {model_name} • 📄 {doc_count} docs • 💬 {msg_count}/{msg_limit} • 🔢 ~{token_est} tokens</div>"
+)
+
+# (label, max context characters) choices for the RAG context length selector
+CONTEXT_LENGTH_OPTIONS = (("Short", 1000), ("Medium", 2000), ("Long", 3000), ("Extended", 4000))
+
+@lru_cache(maxsize=32)
+def _strip_models_prefix(name: str) -> str:
+    """Model name without the API's "models/" prefix"""
+    return name.split("/", 1)[1] if name.startswith("models/") else name
+
+# Version segment of a model name, e.g. "gemini-2.5-flash" -> (2, 5)
+_VER_RE = re.compile(r"(?:^|-)(\d+)\.(\d+)(?=-|$)")
+
+def _ver_key(model_name: str):
+    """Sort key for model names by their major.minor version (0, 0 when absent)"""
+    m = _VER_RE.search(model_name)
+    return (int(m[1]), int(m[2])) if m else (0, 0)
+
 # --- Modern CSS Styling ---
-def apply_custom_css():
-    """Apply modern CSS styling inspired by Perplexity and Gemini"""
-    st.markdown("""
+_CSS_HEAD = """
     <style>
     /* Import Google Fonts */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
@@ -77,20 +290,21 @@ def apply_custom_css():
         --radius-xl: 16px;
     }
     
-    /* Dark mode variables */
-    @media (prefers-color-scheme: dark) {
-        :root {
-            --background: #0f172a;
-            --surface: #1e293b;
-            --surface-variant: #334155;
-            --text-primary: #f8fafc;
-            --text-secondary: #cbd5e1;
-            --text-tertiary: #64748b;
-            --border-color: #334155;
-            --border-light: #1e293b;
-        }
-    }
-    
+"""
+
+# Dark palette overrides for the :root variables above
+_CSS_DARK_VARS = """
+        --background: #0f172a;
+        --surface: #1e293b;
+        --surface-variant: #334155;
+        --text-primary: #f8fafc;
+        --text-secondary: #cbd5e1;
+        --text-tertiary: #64748b;
+        --border-color: #334155;
+        --border-light: #1e293b;
+"""
+
+_CSS_BASE = """
     /* Base Styles */
     .stApp {
         font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
@@ -329,8 +543,75 @@ def apply_custom_css():
             margin-right: 5%;
         }
     }
+    
+    /* Animations, focus states and scrollbar */
+    @keyframes pulse {
+        0%, 100% { opacity: 1; }
+        50% { opacity: 0.5; }
+    }
+    
+    @keyframes fadeIn {
+        from { opacity: 0; transform: translateY(10px); }
+        to { opacity: 1; transform: translateY(0); }
+    }
+    
+    .modern-card {
+        animation: fadeIn 0.3s ease-out;
+    }
+    
+    /* Smooth scroll behavior */
+    html {
+        scroll-behavior: smooth;
+    }
+    
+    /* Enhanced focus states */
+    button:focus, input:focus, textarea:focus {
+        outline: 2px solid var(--primary-color);
+        outline-offset: 2px;
+    }
+    
+    /* Loading states */
+    .stSpinner > div {
+        border-color: var(--primary-color) transparent transparent transparent;
+    }
+    
+    /* Better scrollbar */
+    ::-webkit-scrollbar {
+        width: 8px;
+        height: 8px;
+    }
+    
+    ::-webkit-scrollbar-track {
+        background: var(--surface-variant);
+        border-radius: 4px;
+    }
+    
+    ::-webkit-scrollbar-thumb {
+        background: var(--border-color);
+        border-radius: 4px;
+    }
+    
+    ::-webkit-scrollbar-thumb:hover {
+        background: var(--text-tertiary);
+    }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+# Full stylesheet per configured theme.base: a fixed theme ships only its own palette,
+# an unset theme follows the browser's color-scheme preference
+_CUSTOM_CSS_BY_THEME = {
+    "light": _CSS_HEAD + _CSS_BASE,
+    "dark": _CSS_HEAD + "    :root {" + _CSS_DARK_VARS + "    }\n" + _CSS_BASE,
+    None: _CSS_HEAD + "    @media (prefers-color-scheme: dark) {\n    :root {" + _CSS_DARK_VARS + "    }\n    }\n" + _CSS_BASE,
+}
+
+
+def apply_custom_css():
+    """Apply modern CSS styling inspired by Perplexity and Gemini"""
+    # Emitted on every run: Streamlit drops elements a rerun does not re-render,
+    # so a once-per-session guard would strip the styling after the first interaction
+    theme = st.get_option("theme.base")
+    st.markdown(_CUSTOM_CSS_BY_THEME.get(theme, _CUSTOM_CSS_BY_THEME[None]), unsafe_allow_html=True)
 
 # --- 1. Page Configuration and Modern Header ---
 
@@ -349,25 +630,21 @@ st.set_page_config(
 # Apply custom CSS
 apply_custom_css()
 
-# Determine embed / compact mode (query param or env)
-embed_mode = False
-try:
-    # Query params available only during script run
-    qp = st.query_params if hasattr(st, 'query_params') else st.experimental_get_query_params()
-    if qp:
-        # Accept values like '1', 'true', 'yes'
-        raw = qp.get('embed')
-        if isinstance(raw, list):
-            raw = raw[0]
-        if raw is not None and str(raw).lower() in {"1", "true", "yes"}:
-            embed_mode = True
-except Exception:
-    pass
-
-if not embed_mode:
-    # Allow env override when query param absent
-    if os.getenv("EMBED_MODE", "").lower() in {"1", "true", "yes"}:
-        embed_mode = True
+# Determine embed / compact mode (query param or env), resolved once per session:
+# the query string is fixed for the lifetime of a browser session
+embed_mode = st.session_state.get("_embed_mode")
+if embed_mode is None:
+    embed_mode = _ENV_EMBED
+    if not embed_mode:
+        try:
+            # Query params available only during script run; accept values like '1', 'true', 'yes'
+            raw = _query_params_get().get('embed')
+            if isinstance(raw, list):
+                raw = raw[0] if raw else None
+            embed_mode = str(raw or "").lower() in {"1", "true", "yes"}
+        except Exception:
+            pass
+    st.session_state._embed_mode = embed_mode
 
 if not embed_mode:
     # Custom Modern Header (suppressed in embed mode for tighter iframe usage)
@@ -406,6 +683,156 @@ else:
     # Compact top spacer
     st.markdown("<div style='margin-top:0.5rem'></div>", unsafe_allow_html=True)
 
+# Streamlit >= 1.33 can rerun a decorated block on its own; older versions rerun the whole script
+_fragment = st.fragment if hasattr(st, "fragment") else (lambda func: func)
+
+
+@_fragment
+def _rag_settings():
+    """RAG settings panel. Its widgets only rerun this fragment; the chat path reads the
+    chosen values from session_state on the next full run."""
+    with st.container():
+        st.markdown("#### 📚 RAG Configuration")
+
+        # Chunking controls (adjustable) - applied as one change on submit, so typing
+        # into the inputs neither reruns nor switches the processor
+        default_chunk_size = st.session_state.get("_chunk_size", 1000)
+        default_overlap = st.session_state.get("_chunk_overlap", 200)
+        with st.expander("🔧 Chunk Settings", expanded=False):
+            with st.form("chunk_settings_form", clear_on_submit=False, border=False):
+                new_chunk_size = st.number_input(
+                    "Chunk Size (characters)",
+                    min_value=200, max_value=4000, step=100,
+                    value=default_chunk_size,
+                    help="Length of each text chunk for embedding. Larger = fewer, bigger chunks; smaller = finer retrieval granularity."
+                )
+                new_chunk_overlap = st.number_input(
+                    "Chunk Overlap",
+                    min_value=0, max_value=1000, step=50,
+                    value=default_overlap,
+                    help="Characters of overlap between adjacent chunks to preserve context continuity."
+                )
+                applied = st.form_submit_button("Apply")
+            if applied and ((new_chunk_size != default_chunk_size) or (new_chunk_overlap != default_overlap)):
+                st.session_state._chunk_size = int(new_chunk_size)
+                st.session_state._chunk_overlap = int(new_chunk_overlap)
+                # Switch to the (cached) document processor for the new settings
+                st.session_state.doc_processor = create_document_processor(
+                    chunk_size=st.session_state._chunk_size,
+                    chunk_overlap=st.session_state._chunk_overlap
+                )
+                st.info(f"🔄 Chunk settings updated: size={st.session_state._chunk_size}, overlap={st.session_state._chunk_overlap}. Re-process documents to apply.")
+        
+        use_rag = st.checkbox(
+            "Enable RAG", 
+            value=True, 
+            help="Use uploaded documents to enhance responses",
+            key="use_rag"
+        )
+        
+        if use_rag:
+            col1, col2 = st.columns(2)
+            with col1:
+                num_context_docs = st.selectbox(
+                    "Context Docs",
+                    options=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+                    index=2,
+                    help="Number of relevant documents to use as context"
+                )
+            
+            with col2:
+                length_idx = st.selectbox(
+                    "Context Length",
+                    options=range(len(CONTEXT_LENGTH_OPTIONS)),
+                    format_func=lambda i: CONTEXT_LENGTH_OPTIONS[i][0],
+                    index=1,
+                    help="Maximum length of context from documents"
+                )
+                max_context_length = CONTEXT_LENGTH_OPTIONS[length_idx][1]
+        else:
+            num_context_docs = 3
+            max_context_length = 2000
+        st.session_state.num_context_docs = num_context_docs
+        st.session_state.max_context_length = max_context_length
+
+
+@_fragment
+def _conversation_transfer(conv_manager):
+    """Conversation export/import panel; format and category picks only rerun this fragment."""
+    conversations = conv_manager.list_conversations(limit=1000)
+        
+    if conversations:
+        st.markdown("**📤 Export Options:**")
+            
+        # Category filter for export
+        categories = ["All Categories"] + conv_manager.get_categories()
+        export_category = st.selectbox(
+            "Export Category",
+            categories,
+            help="Select category to export"
+        )
+            
+        export_format = st.selectbox(
+            "Export Format",
+            ["JSON", "CSV"],
+            help="Choose export format"
+        )
+            
+        if st.button("📤 Export Conversations", use_container_width=True):
+            try:
+                category_filter = None if export_category == "All Categories" else export_category
+                export_data = conv_manager.export_conversations(
+                    format_type=export_format.lower(),
+                    category=category_filter
+                )
+                    
+                filename = f"conversations_{export_category.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format.lower()}"
+                mime_type = "application/json" if export_format == "JSON" else "text/csv"
+                    
+                st.download_button(
+                    f"📥 Download {export_format}",
+                    data=export_data,
+                    file_name=filename,
+                    mime=mime_type,
+                    use_container_width=True
+                )
+                st.success(f"✅ Export ready! Click to download {len(conversations)} conversations.")
+            except Exception as e:
+                st.error(f"Export failed: {e}")
+            
+        # Import functionality
+        st.markdown("**📥 Import Conversations:**")
+        uploaded_conv_file = st.file_uploader(
+            "Import Conversations",
+            type=["json"],
+            help="Upload a previously exported conversation file",
+            key="conv_import"
+        )
+            
+        if uploaded_conv_file:
+            if st.button("📥 Import Conversations", use_container_width=True):
+                try:
+                    import_data = uploaded_conv_file.read().decode('utf-8')
+                    imported, errors = conv_manager.import_conversations(import_data, "json")
+                        
+                    if imported > 0:
+                        st.success(f"✅ Successfully imported {imported} conversations!")
+                        if errors > 0:
+                            st.warning(f"⚠️ {errors} conversations failed to import")
+                        st.rerun()
+                    else:
+                        st.error("❌ No conversations were imported")
+                except Exception as e:
+                    st.error(f"Import failed: {e}")
+
+
+def _on_model_change():
+    """Reset chats & messages for consistency when the sidebar model changes"""
+    st.session_state.pop("chat", None)
+    st.session_state.pop("messages", None)
+    st.session_state.pop("model_chats", None)
+
+
 # --- 2. Modern Sidebar Configuration ---
 
 with st.sidebar:
@@ -431,11 +858,11 @@ with st.sidebar:
             if ("available_models" in st.session_state) and not force:
                 return
             # Support legacy alias DEFAULT_MODEL if GEMINI_DEFAULT_MODEL not set
-            env_default = os.getenv("GEMINI_DEFAULT_MODEL") or os.getenv("DEFAULT_MODEL")
+            env_default = _ENV_DEFAULT_MODEL
             # Base fallback now includes 2.5 + 1.5 (priority order updated)
             base_fallback = ["gemini-2.5-flash", "gemini-2.5-flash-8b", "gemini-1.5-flash", "gemini-1.5-flash-8b"]
             if env_default:
-                env_base = env_default.split("/", 1)[1] if env_default.startswith("models/") else env_default
+                env_base = _strip_models_prefix(env_default)
                 if env_base not in base_fallback:
                     base_fallback.insert(0, env_base)
             models = []
@@ -444,12 +871,13 @@ with st.sidebar:
             try:
                 client = st.session_state.get("genai_client")
                 if client is not None:
-                    raw_list = list(client.models.list())  # type: ignore[attr-defined]
-                    for m in raw_list:
-                        name = getattr(m, "name", "") or ""
+                    key_hash = hashlib.blake2b((google_api_key or "").encode(), digest_size=8).hexdigest()
+                    if force:
+                        _list_gemini_models.clear()
+                        _dead_models(key_hash).clear()
+                    for name in _list_gemini_models(key_hash, client):
                         raw_models.append(name)
-                        if name.startswith("models/"):
-                            name = name.split("/", 1)[1]
+                        name = _strip_models_prefix(name)
                         lname = name.lower()
                         if "flash" in lname and not any(x in lname for x in ["pro", "vision", "exp"]):
                             models.append(name)
@@ -460,16 +888,6 @@ with st.sidebar:
             models = sorted(set(models))
             if not models:
                 models = base_fallback
-            def _ver_key(model_name: str):
-                try:
-                    parts = model_name.split("-")
-                    for p in parts:
-                        if p.replace(".", "").isdigit() and "." in p:
-                            maj, min_ = p.split(".")
-                            return (int(maj), int(min_))
-                    return (0, 0)
-                except Exception:
-                    return (0, 0)
             models_sorted = sorted(models, key=_ver_key, reverse=True)
             ordered = []
             for bf in base_fallback:
@@ -478,7 +896,18 @@ with st.sidebar:
             for m in models_sorted:
                 if m not in ordered:
                     ordered.append(m)
-            st.session_state.available_models = ordered
+            # Honor the environment default by listing it first
+            if env_default:
+                env_base = _strip_models_prefix(env_default)
+                if env_base not in ordered:
+                    relaxed = env_base.replace("-latest", "")
+                    mapped = next((m for m in ordered if m.startswith(relaxed)), None)
+                    if mapped:
+                        env_base = mapped
+                if env_base in ordered and ordered[0] != env_base:
+                    ordered.remove(env_base)
+                    ordered.insert(0, env_base)
+            st.session_state.available_models = tuple(ordered)
             st.session_state.model_discovery_debug = {
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
                 "env_default": env_default,
@@ -496,30 +925,23 @@ with st.sidebar:
                 _discover_models(force=True)
         _discover_models(force=False)
 
-        available_models = st.session_state.get("available_models", ["gemini-2.5-flash", "gemini-1.5-flash"])
-
-        # Attempt to honor environment default
-        env_default = os.getenv("GEMINI_DEFAULT_MODEL") or os.getenv("DEFAULT_MODEL")
-        if env_default:
-            env_base = env_default.split("/", 1)[1] if env_default.startswith("models/") else env_default
-            if env_base not in available_models:
-                relaxed = env_base.replace("-latest", "")
-                mapped = next((m for m in available_models if m.startswith(relaxed)), None)
-                if mapped:
-                    env_base = mapped
-            if env_base in available_models and available_models[0] != env_base:
-                available_models = [env_base] + [m for m in available_models if m != env_base]
+        # Already ordered with the environment default first (see _discover_models)
+        available_models = st.session_state.get("available_models", ("gemini-2.5-flash", "gemini-1.5-flash"))
+        env_default = _ENV_DEFAULT_MODEL
         # Initialize selection
         if "selected_model" not in st.session_state:
             st.session_state.selected_model = available_models[0]
         elif st.session_state.selected_model not in available_models:
             # Preserve legacy/previous value by appending so selector can show it
-            available_models = available_models + [st.session_state.selected_model]
+            available_models = available_models + (st.session_state.selected_model,)
 
-        chosen_model = st.selectbox(
+        # Bound to session_state.selected_model; a change resets chats in the callback so the
+        # widget's own rerun already renders the new state
+        st.selectbox(
             "Gemini Model",
             options=available_models,
-            index=available_models.index(st.session_state.selected_model) if st.session_state.selected_model in available_models else 0,
+            key="selected_model",
+            on_change=_on_model_change,
             help="Choose an available Gemini Flash model. List is discovered dynamically.",
         )
 
@@ -550,80 +972,10 @@ with st.sidebar:
                 st.write("Filtered models:", dbg.get("filtered_models"))
                 st.write("Final available:", dbg.get("final_available"))
 
-        if chosen_model != st.session_state.selected_model:
-            st.session_state.selected_model = chosen_model
-            # Reset chats & messages for consistency
-            st.session_state.pop("chat", None)
-            st.session_state.pop("messages", None)
-            st.session_state.pop("model_chats", None)
-            st.rerun()
-
     st.divider()
     
     # RAG Settings Section
-    with st.container():
-        st.markdown("#### 📚 RAG Configuration")
-
-        # Chunking controls (adjustable) - recreate processor if changed
-        default_chunk_size = st.session_state.get("_chunk_size", 1000)
-        default_overlap = st.session_state.get("_chunk_overlap", 200)
-        with st.expander("🔧 Chunk Settings", expanded=False):
-            new_chunk_size = st.number_input(
-                "Chunk Size (characters)",
-                min_value=200, max_value=4000, step=100,
-                value=default_chunk_size,
-                help="Length of each text chunk for embedding. Larger = fewer, bigger chunks; smaller = finer retrieval granularity."
-            )
-            new_chunk_overlap = st.number_input(
-                "Chunk Overlap",
-                min_value=0, max_value=1000, step=50,
-                value=default_overlap,
-                help="Characters of overlap between adjacent chunks to preserve context continuity."
-            )
-            if (new_chunk_size != default_chunk_size) or (new_chunk_overlap != default_overlap):
-                st.session_state._chunk_size = int(new_chunk_size)
-                st.session_state._chunk_overlap = int(new_chunk_overlap)
-                # Recreate document processor with new settings
-                from document_processor import DocumentProcessor
-                st.session_state.doc_processor = DocumentProcessor(
-                    chunk_size=st.session_state._chunk_size,
-                    chunk_overlap=st.session_state._chunk_overlap
-                )
-                st.info(f"🔄 Chunk settings updated: size={st.session_state._chunk_size}, overlap={st.session_state._chunk_overlap}. Re-process documents to apply.")
-        
-        use_rag = st.checkbox(
-            "Enable RAG", 
-            value=True, 
-            help="Use uploaded documents to enhance responses"
-        )
-        
-        if use_rag:
-            col1, col2 = st.columns(2)
-            with col1:
-                num_context_docs = st.selectbox(
-                    "Context Docs",
-                    options=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
-                    index=2,
-                    help="Number of relevant documents to use as context"
-                )
-            
-            with col2:
-                context_length_options = {
-                    "Short": 1000,
-                    "Medium": 2000,
-                    "Long": 3000,
-                    "Extended": 4000
-                }
-                selected_length = st.selectbox(
-                    "Context Length",
-                    options=list(context_length_options.keys()),
-                    index=1,
-                    help="Maximum length of context from documents"
-                )
-                max_context_length = context_length_options[selected_length]
-        else:
-            num_context_docs = 3
-            max_context_length = 2000
+    _rag_settings()
     
     st.divider()
     
@@ -631,16 +983,9 @@ with st.sidebar:
     with st.container():
         st.markdown("#### 💾 Conversation Management")
         
-        # Initialize conversation manager
-        if "conv_manager" not in st.session_state:
-            st.session_state.conv_manager = get_conversation_manager()
-        
-        # Initialize analytics tracker
-        if "analytics_tracker" not in st.session_state:
-            st.session_state.analytics_tracker = get_analytics_tracker()
-        
-        conv_manager = st.session_state.conv_manager
-        analytics = st.session_state.analytics_tracker
+        # Conversation manager and analytics tracker (both shared cache_resource instances)
+        conv_manager = st.session_state.setdefault("conv_manager", get_conversation_manager())
+        analytics = st.session_state.setdefault("analytics_tracker", get_analytics_tracker())
         
         # Auto-save current conversation
         if st.session_state.get("messages") and len(st.session_state.messages) > 0:
@@ -658,7 +1003,7 @@ with st.sidebar:
                     updated_at=datetime.now(),
                     category=category,
                     message_count=len(current_messages),
-                    total_tokens=st.session_state.get("token_estimate_total", 0)
+                    total_tokens=_token_estimate_total()
                 )
                 
                 if conv_manager.save_conversation(conversation):
@@ -666,6 +1011,18 @@ with st.sidebar:
                 else:
                     st.error("Failed to save conversation")
         
+        # Wait for the auto-save queued by the previous run so the list below includes it,
+        # and surface its failure here (the background writer cannot)
+        pending_save = st.session_state.pop("_pending_save", None)
+        if pending_save is not None:
+            save_error = None
+            try:
+                save_error = pending_save.exception(timeout=5)
+            except Exception:
+                st.session_state._pending_save = pending_save  # still running; checked again next run
+            if save_error is not None:
+                st.warning(f"⚠️ Conversation auto-save failed: {save_error}")
+        
         # Load conversation selector
         conversations = conv_manager.list_conversations(limit=20)
         if conversations:
@@ -687,11 +1044,12 @@ with st.sidebar:
                 
                 with col1:
                     if st.button("📂 Load", use_container_width=True):
-                        st.session_state.messages = selected_conv.messages.copy()
-                        st.session_state.message_count = selected_conv.message_count
-                        st.session_state.token_estimate_total = selected_conv.total_tokens
-                        st.success(f"📂 Loaded: {selected_conv.title}")
-                        st.rerun()
+                        loaded_conv = conv_manager.load_conversation(selected_conv.id)
+                        if loaded_conv:
+                            st.session_state.messages = loaded_conv.messages.copy()
+                            st.session_state.message_count = loaded_conv.message_count
+                            st.success(f"📂 Loaded: {loaded_conv.title}")
+                            st.rerun()
                 
                 with col2:
                     if st.button("🗑️ Delete", use_container_width=True):
@@ -742,6 +1100,7 @@ with st.sidebar:
             if st.button("🗑️ Clear Docs", help="Remove all uploaded documents", use_container_width=True):
                 if "vector_db" in st.session_state:
                     st.session_state.vector_db.clear_collection()
+                    st.session_state.pop("chunk_hashes", None)
                     st.rerun()
         
         with col2:
@@ -750,7 +1109,6 @@ with st.sidebar:
                 st.session_state.pop("messages", None)
                 st.session_state.pop("current_conversation_id", None)  # Reset conversation ID for new conversation
                 st.session_state.message_count = 0
-                st.session_state.token_estimate_total = 0
                 st.rerun()
     
     st.divider()
@@ -758,56 +1116,47 @@ with st.sidebar:
     # Quick Stats (expanded)
     info = None
     if "vector_db" in st.session_state:
-        info = st.session_state.vector_db.get_collection_info()
+        info = get_collection_info(st.session_state.vector_db)
     doc_count = (info or {}).get("document_count", 0)
     model_name = st.session_state.get("selected_model", "gemini-1.5-flash")
     msg_count = st.session_state.get("message_count", 0)
-    msg_limit = int(os.getenv("CHAT_MESSAGE_LIMIT", "50"))
-    token_est = st.session_state.get("token_estimate_total", 0)
+    msg_limit = _CHAT_MESSAGE_LIMIT
+    token_est = _token_estimate_total()
 
     st.markdown("#### 📊 Quick Stats")
     if embed_mode:
         st.markdown(
-            f"<div class='modern-card' style='padding:0.75rem; font-size:0.75rem; line-height:1.4;'>🧠 {model_name} • 📄 {doc_count} docs • 💬 {msg_count}/{msg_limit} • 🔢 ~{token_est} tokens</div>",
+            _QUICK_STATS_TEMPLATE.format_map({
+                "model_name": model_name, "doc_count": doc_count,
+                "msg_count": msg_count, "msg_limit": msg_limit, "token_est": token_est,
+            }),
             unsafe_allow_html=True
         )
     else:
-        st.markdown(f"""
-        <div class="modern-card" style="padding: 1rem;">
-            <div style="display:flex; justify-content:space-between; gap:0.75rem; flex-wrap:wrap;">
-                <div style="text-align:center; min-width:80px;">
-                    <div style="font-size:1.25rem; font-weight:600; color:var(--primary-color);">{doc_count}</div>
-                    <div style="font-size:0.65rem; text-transform:uppercase; letter-spacing:0.05em; color:var(--text-secondary);">Docs</div>
-                </div>
-                <div style="text-align:center; min-width:80px;">
-                    <div style="font-size:1.25rem; font-weight:600; color:var(--primary-color);">{msg_count}/{msg_limit}</div>
-                    <div style="font-size:0.65rem; text-transform:uppercase; letter-spacing:0.05em; color:var(--text-secondary);">Messages</div>
-                </div>
-                <div style="text-align:center; min-width:80px;">
-                    <div style="font-size:1.25rem; font-weight:600; color:var(--primary-color);">~{token_est}</div>
-                    <div style="font-size:0.65rem; text-transform:uppercase; letter-spacing:0.05em; color:var(--text-secondary);">Tokens</div>
-                </div>
-                <div style="flex:1; min-width:140px;">
-                    <div style="font-size:0.6rem; font-weight:600; color:var(--text-tertiary); text-transform:uppercase; letter-spacing:0.05em;">Model</div>
-                    <div style="font-size:0.8rem; font-weight:500; color:var(--text-primary); word-break:break-all;">{model_name}</div>
-                </div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-
-    # Batch export of all sources (if any assistant messages with sources)
-    all_sources = []
-    if "messages" in st.session_state:
-        for m in st.session_state.messages:
-            if m.get("role") == "assistant" and m.get("sources"):
-                all_sources.extend(m["sources"])
+        col1, col2, col3 = st.columns(3)
+        col1.metric("📄 Docs", doc_count)
+        col2.metric("💬 Messages", f"{msg_count}/{msg_limit}")
+        col3.metric("🔢 Tokens", f"~{token_est}")
+        st.caption(f"🧠 **Model:** {model_name}")
+
+    # Batch export of all sources (if any assistant messages with sources).
+    # Kept incrementally: only messages appended since the last rerun are scanned,
+    # and the list is rebuilt from scratch only when the history is replaced or shrinks
+    messages = st.session_state.get("messages", [])
+    scanned = st.session_state.get("_all_sources_scanned")
+    if scanned is None or scanned[0] != id(messages) or scanned[1] > len(messages):
+        st.session_state._all_sources = []
+        scanned = (id(messages), 0)
+    all_sources = st.session_state._all_sources
+    for m in messages[scanned[1]:]:
+        if m.get("role") == "assistant" and m.get("sources"):
+            all_sources.extend(m["sources"])
+    st.session_state._all_sources_scanned = (id(messages), len(messages))
     if all_sources:
         try:
-            import json as _json
-            export_data = _json.dumps(all_sources, ensure_ascii=False, indent=2)
             st.download_button(
                 "⬇️ Export All Sources JSON",
-                data=export_data,
+                data=_download_data(lambda all_sources=all_sources: json.dumps(all_sources, ensure_ascii=False, separators=(",", ":"))),
                 file_name="all_sources.json",
                 mime="application/json",
                 help="Download a consolidated JSON of every source chunk used so far"
@@ -817,72 +1166,12 @@ with st.sidebar:
 
     # Enhanced conversation export
     if "conv_manager" in st.session_state:
-        conv_manager = st.session_state.conv_manager
-        conversations = conv_manager.list_conversations(limit=1000)
-        
-        if conversations:
-            st.markdown("**📤 Export Options:**")
-            
-            # Category filter for export
-            categories = ["All Categories"] + conv_manager.get_categories()
-            export_category = st.selectbox(
-                "Export Category",
-                categories,
-                help="Select category to export"
-            )
-            
-            export_format = st.selectbox(
-                "Export Format",
-                ["JSON", "CSV"],
-                help="Choose export format"
-            )
-            
-            if st.button("📤 Export Conversations", use_container_width=True):
-                try:
-                    category_filter = None if export_category == "All Categories" else export_category
-                    export_data = conv_manager.export_conversations(
-                        format_type=export_format.lower(),
-                        category=category_filter
-                    )
-                    
-                    filename = f"conversations_{export_category.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format.lower()}"
-                    mime_type = "application/json" if export_format == "JSON" else "text/csv"
-                    
-                    st.download_button(
-                        f"📥 Download {export_format}",
-                        data=export_data,
-                        file_name=filename,
-                        mime=mime_type,
-                        use_container_width=True
-                    )
-                    st.success(f"✅ Export ready! Click to download {len(conversations)} conversations.")
-                except Exception as e:
-                    st.error(f"Export failed: {e}")
-            
-            # Import functionality
-            st.markdown("**📥 Import Conversations:**")
-            uploaded_conv_file = st.file_uploader(
-                "Import Conversations",
-                type=["json"],
-                help="Upload a previously exported conversation file",
-                key="conv_import"
-            )
-            
-            if uploaded_conv_file:
-                if st.button("📥 Import Conversations", use_container_width=True):
-                    try:
-                        import_data = uploaded_conv_file.read().decode('utf-8')
-                        imported, errors = conv_manager.import_conversations(import_data, "json")
-                        
-                        if imported > 0:
-                            st.success(f"✅ Successfully imported {imported} conversations!")
-                            if errors > 0:
-                                st.warning(f"⚠️ {errors} conversations failed to import")
-                            st.rerun()
-                        else:
-                            st.error("❌ No conversations were imported")
-                    except Exception as e:
-                        st.error(f"Import failed: {e}")
+        _conversation_transfer(st.session_state.conv_manager)
+
+# RAG settings chosen in the sidebar fragment
+use_rag = st.session_state.get("use_rag", True)
+num_context_docs = st.session_state.get("num_context_docs", 3)
+max_context_length = st.session_state.get("max_context_length", 2000)
 
 # --- 3. API Key Validation ---
 
@@ -893,7 +1182,7 @@ if not google_api_key:
 # Initialize Google AI client
 if ("genai_client" not in st.session_state) or (getattr(st.session_state, "_last_key", None) != google_api_key):
     try:
-        st.session_state.genai_client = genai.Client(api_key=google_api_key)
+        st.session_state.genai_client = get_genai_client(google_api_key)
         st.session_state._last_key = google_api_key
         st.session_state.pop("chat", None)
         st.session_state.pop("messages", None)
@@ -903,21 +1192,16 @@ if ("genai_client" not in st.session_state) or (getattr(st.session_state, "_last
 
 # --- 4. Initialize RAG Components ---
 
-# Initialize document processor
-if "doc_processor" not in st.session_state:
-    # Respect any previously chosen chunk parameters
-    chunk_size = st.session_state.get("_chunk_size", 1000)
-    chunk_overlap = st.session_state.get("_chunk_overlap", 200)
-    from document_processor import DocumentProcessor as _DP
-    st.session_state.doc_processor = _DP(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-
-# Initialize vector database
-if "vector_db" not in st.session_state:
-    st.session_state.vector_db = get_vector_database("rag_chatbot_docs")
+# Initialize document processor (respecting any previously chosen chunk parameters) and
+# vector database; both factories are cached, so the eager default costs a cache lookup
+st.session_state.setdefault("doc_processor", create_document_processor(
+    chunk_size=st.session_state.get("_chunk_size", 1000),
+    chunk_overlap=st.session_state.get("_chunk_overlap", 200)
+))
+st.session_state.setdefault("vector_db", get_vector_database("rag_chatbot_docs"))
 
 # Initialize session ID for analytics
 if "session_id" not in st.session_state:
-    import uuid
     st.session_state.session_id = str(uuid.uuid4())[:8]
 
 # --- 5. Modern File Upload Section ---
@@ -957,32 +1241,17 @@ with upload_container:
         total_size = 0
         
         for file in uploaded_files:
-            file_size_mb = len(file.getvalue()) / (1024 * 1024)
+            file_size_mb = file.size / (1024 * 1024)  # recorded size; no need to touch the payload
             total_size += file_size_mb
             files_info.append({
                 "name": file.name,
                 "size": f"{file_size_mb:.1f} MB",
-                "type": file.type or "Unknown"
+                "type": file.type or "Unknown",
+                "icon": _FILE_ICONS.get(file.type, "📎")
             })
         
-        # Display file cards
-        for i, file_info in enumerate(files_info):
-            st.markdown(f"""
-            <div class="modern-card" style="margin: 0.5rem 0; padding: 1rem;">
-                <div style="display: flex; justify-content: space-between; align-items: center;">
-                    <div style="display: flex; align-items: center; gap: 1rem;">
-                        <div style="font-size: 1.5rem;">
-                            {'📄' if file_info['type'] == 'text/plain' else '📘' if 'word' in file_info['type'] else '📕'}
-                        </div>
-                        <div>
-                            <div style="font-weight: 500; color: var(--text-primary);">{file_info['name']}</div>
-                            <div style="font-size: 0.875rem; color: var(--text-secondary);">{file_info['size']} • {file_info['type']}</div>
-                        </div>
-                    </div>
-                    <div class="status-badge status-success">Ready</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        # Display file cards in a single markdown block
+        st.markdown("\n".join(_FILE_CARD_TEMPLATE.format_map(f) for f in files_info), unsafe_allow_html=True)
         
         # Processing button with enhanced styling
         st.markdown("<br>", unsafe_allow_html=True)
@@ -1014,55 +1283,65 @@ with upload_container:
                         status_text.text("💾 Storing in vector database (filtering duplicates)...")
                         progress_bar.progress(75)
 
-                        if "chunk_hashes" not in st.session_state:
-                            st.session_state.chunk_hashes = set()
+                        st.session_state.setdefault("chunk_hashes", set())
 
-                        import hashlib as _hashlib
                         unique_docs = []
                         skipped = 0
 
-                        # Build an existing hash set from persisted collection once per run (metadata scan)
-                        existing_hashes = set()
-                        try:
-                            existing = st.session_state.vector_db.collection.get(include=["metadatas"], limit=100000)
-                            for meta in existing.get("metadatas", []) or []:
-                                if not meta:
-                                    continue
-                                for m in meta if isinstance(meta, list) else [meta]:
-                                    h = m.get("chunk_hash") if isinstance(m, dict) else None
-                                    if h:
-                                        existing_hashes.add(h)
-                        except Exception:
-                            pass
-
+                        # Hashes already persisted in the collection: scanned once per process and kept
+                        # current by every upload; rescanned only after a change nobody recorded (a clear)
+                        persisted = _persisted_chunk_hashes(st.session_state.vector_db, st.session_state.vector_db.collection_name)
+                        db_version = getattr(st.session_state.vector_db, "version", 0)
+                        if persisted["version"] != db_version:
+                            existing_hashes = set()
+                            try:
+                                existing_hashes = st.session_state.vector_db.stored_chunk_hashes()
+                            except Exception:
+                                pass
+                            persisted["hashes"] = existing_hashes
+                            persisted["version"] = db_version
+                        existing_hashes = persisted["hashes"]
+                        new_hashes = []
+
+                        # All chunks come from one processor and share a type: pick the accessors once
+                        if isinstance(documents[0], dict):
+                            def chunk_content(d):
+                                return d.get('page_content') or d.get('document')
+                            def chunk_metadata(d):
+                                return d.setdefault('metadata', {})
+                        else:
+                            def chunk_content(d):
+                                return d.page_content
+                            def chunk_metadata(d):
+                                if d.metadata is None:
+                                    d.metadata = {}
+                                return d.metadata
+
+                        session_hashes = st.session_state.chunk_hashes
                         for d in documents:
-                            content = getattr(d, 'page_content', None)
-                            if content is None and isinstance(d, dict):
-                                content = d.get('page_content') or d.get('document')
-                            text_for_hash = (content or '').strip()
+                            text_for_hash = (chunk_content(d) or '').strip()
                             if not text_for_hash:
                                 continue
-                            h = _hashlib.sha1(text_for_hash.encode('utf-8', errors='ignore')).hexdigest()
-                            if h in st.session_state.chunk_hashes or h in existing_hashes:
+                            h = _chunk_hash(text_for_hash)
+                            if h in session_hashes or h in existing_hashes:
                                 skipped += 1
                                 continue
-                            st.session_state.chunk_hashes.add(h)
+                            session_hashes.add(h)
+                            new_hashes.append(h)
                             # attach hash to metadata for persistence
-                            try:
-                                meta_attr = getattr(d, 'metadata', None)
-                                if meta_attr is not None and isinstance(meta_attr, dict):
-                                    meta_attr['chunk_hash'] = h
-                                elif isinstance(d, dict):
-                                    d.setdefault('metadata', {})
-                                    if isinstance(d['metadata'], dict):
-                                        d['metadata']['chunk_hash'] = h
-                            except Exception:
-                                pass
+                            chunk_metadata(d)['chunk_hash'] = h
                             unique_docs.append(d)
 
                         success = True
                         if unique_docs:
-                            success = st.session_state.vector_db.add_documents(unique_docs)
+                            # Advance the bar from 75% to 100% as each stored batch completes
+                            success = st.session_state.vector_db.add_documents(
+                                unique_docs,
+                                progress_callback=lambda done, total: progress_bar.progress(75 + int(25 * done / total))
+                            )
+                            if success:
+                                existing_hashes.update(new_hashes)
+                                persisted["version"] = getattr(st.session_state.vector_db, "version", 0)
                         
                         progress_bar.progress(100)
                         status_text.text("✅ Processing complete!")
@@ -1070,7 +1349,6 @@ with upload_container:
                         # Track analytics for document processing
                         if "analytics_tracker" in st.session_state:
                             analytics = st.session_state.analytics_tracker
-                            import uuid
                             event_id = str(uuid.uuid4())[:12]
                             
                             analytics.track_event(AnalyticsEvent(
@@ -1128,23 +1406,13 @@ with upload_container:
 
 # Enhanced vector database info display
 if "vector_db" in st.session_state:
-    info = st.session_state.vector_db.get_collection_info()
+    info = get_collection_info(st.session_state.vector_db)
     doc_count = info.get("document_count", 0)
     
     if doc_count > 0:
         st.markdown("#### 📊 Knowledge Base Status")
         
-        st.markdown(f"""
-        <div class="modern-card" style="background: linear-gradient(135deg, var(--accent-color), var(--primary-color)); color: white;">
-            <div style="display: flex; justify-content: space-between; align-items: center;">
-                <div>
-                    <div style="font-size: 1.25rem; font-weight: 600;">Knowledge Base Active</div>
-                    <div style="opacity: 0.9; font-size: 0.875rem;">{doc_count} documents ready for queries</div>
-                </div>
-                <div style="font-size: 2rem;">🧠</div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_KB_STATUS_TEMPLATE.format_map({"doc_count": doc_count}), unsafe_allow_html=True)
 
 # --- 6. Analytics Dashboard (if requested) ---
 
@@ -1179,10 +1447,11 @@ if st.session_state.get("show_analytics", False):
         st.markdown("### 📤 Export Analytics")
         if st.button("📥 Download Analytics Report", use_container_width=True):
             try:
-                export_data = analytics.export_analytics(analytics_period)
+                export_buf = io.BytesIO()
+                analytics.export_analytics_stream(analytics_period, export_buf)
                 st.download_button(
                     "📥 Download JSON Report",
-                    data=export_data,
+                    data=export_buf.getvalue(),
                     file_name=f"analytics_report_{analytics_period}d_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                     mime="application/json",
                     use_container_width=True
@@ -1203,11 +1472,33 @@ if not embed_mode:
     st.markdown("### 💬 Conversation")
 
 # Maintain a dict of chat sessions per model for per-message selection
-if "model_chats" not in st.session_state:
-    st.session_state.model_chats = {}
+st.session_state.setdefault("model_chats", {})
 
-def get_chat_for_model(model: str):
+@lru_cache(maxsize=32)
+def _build_candidates(model: str, env_default: Optional[str]) -> tuple:
+    """Model names to try for a requested model, in fallback order (raw & models/-prefixed)"""
+    candidates = []
+
+    def _add_pair(name: str):
+        base = _strip_models_prefix(name)
+        for candidate in (base, f"models/{base}"):
+            if candidate not in candidates:
+                candidates.append(candidate)
+
+    requested_base = _strip_models_prefix(model)
+    _add_pair(requested_base)
+    if env_default:
+        env_base = _strip_models_prefix(env_default)
+        if env_base != requested_base:
+            _add_pair(env_base)
+    for fallback in ["gemini-2.5-flash", "gemini-2.5-flash-8b", "gemini-1.5-flash", "gemini-1.5-flash-8b"]:
+        if fallback != requested_base:
+            _add_pair(fallback)
+    return tuple(candidates)
+
+def get_chat_for_model(model: str, history: Optional[List[Dict[str, Any]]] = None):
     """Return (or lazily create) a chat object for a given model with extended fallback logic.
+    `history` (Gemini content dicts) seeds a newly created chat; ignored if the chat exists.
     Order of attempts:
       1. Requested model (raw & prefixed)
       2. Env default (raw & prefixed) if different
@@ -1219,45 +1510,22 @@ def get_chat_for_model(model: str):
 
     client = st.session_state.genai_client
     tried = []
-    candidates = []
-
-    def _norm(name: str):
-        return name.split("/", 1)[1] if name.startswith("models/") else name
-    def _add_pair(name: str):
-        base = _norm(name)
-        raw = base
-        pref = f"models/{base}"
-        if raw not in candidates:
-            candidates.append(raw)
-        if pref not in candidates:
-            candidates.append(pref)
-
-    requested_base = _norm(model)
-    _add_pair(requested_base)
-
-    env_default = os.getenv("GEMINI_DEFAULT_MODEL")
-    if env_default:
-        env_base = _norm(env_default)
-        if env_base != requested_base:
-            _add_pair(env_base)
-
-    for fallback in ["gemini-2.5-flash", "gemini-2.5-flash-8b", "gemini-1.5-flash", "gemini-1.5-flash-8b"]:
-        if fallback != requested_base:
-            _add_pair(fallback)
+    candidates = _build_candidates(model, _ENV_GEMINI_MODEL)
+    _norm = _strip_models_prefix
 
+    # Shared across sessions using the same key, so known-bad names cost no further API calls
+    dead = _dead_models(hashlib.blake2b((st.session_state.get("_last_key") or "").encode(), digest_size=8).hexdigest())
     last_err = None
     for candidate in candidates:
-        if candidate in tried:
+        if candidate in tried or candidate in dead:
             continue
         tried.append(candidate)
         try:
-            chat_obj = client.chats.create(model=candidate)
+            chat_obj = client.chats.create(model=candidate, history=history)
             actual = _norm(candidate)
             st.session_state.model_chats[model] = chat_obj
             # Track resolution mapping
-            if "_model_resolution" not in st.session_state:
-                st.session_state._model_resolution = {}
-            st.session_state._model_resolution[model] = actual
+            st.session_state.setdefault("_model_resolution", {})[model] = actual
             # Attach attribute for quick access
             try:
                 chat_obj._actual_model = actual  # type: ignore[attr-defined]
@@ -1265,13 +1533,15 @@ def get_chat_for_model(model: str):
                 pass
             return chat_obj
         except Exception as e:  # noqa: BLE001
+            # Only a missing model is worth remembering; bad history, quota or network errors are not the model's fault
+            if _is_model_unavailable(e):
+                dead.add(candidate)
             last_err = e
             continue
     raise RuntimeError(f"Failed to create chat for model '{model}'. Tried: {tried}. Last error: {last_err}")
 
 # Initialize message history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+st.session_state.setdefault("messages", [])
 
 # Display chat messages using Streamlit's native chat components
 if not st.session_state.messages:
@@ -1310,19 +1580,15 @@ for i, msg in enumerate(st.session_state.messages):
                 st.write("Response copied! (Use Ctrl+C/Cmd+C to copy from the text above)")
                 st.code(msg["content"], language=None)
 
-# Show sources blocks (outside scroll to keep window performant)
-for i, msg in enumerate(st.session_state.messages):
-    if msg.get("role") == "assistant" and msg.get("sources"):
-        exp_label = f"📚 Sources Used ({len(msg['sources'])} documents)"
-        with st.expander(exp_label, expanded=False):
-            for idx, source in enumerate(msg["sources"], 1):
-                relevance_score = 1 - source['distance']
-                relevance_color = (
-                    "var(--success-color)" if relevance_score > 0.8 else
-                    "var(--warning-color)" if relevance_score > 0.6 else
-                    "var(--error-color)"
-                )
-                st.markdown(f"""
+def _render_source_card(source: Dict[str, Any]) -> str:
+    """HTML card for one retrieved source chunk"""
+    relevance_score = 1 - source['distance']
+    relevance_color = (
+        "var(--success-color)" if relevance_score > 0.8 else
+        "var(--warning-color)" if relevance_score > 0.6 else
+        "var(--error-color)"
+    )
+    return f"""
                 <div class='modern-card' style='margin:0.5rem 0; padding:1rem;'>
                     <div style='display:flex; justify-content:between; align-items:start; gap:1rem;'>
                         <div style='flex:1;'>
@@ -1335,24 +1601,38 @@ for i, msg in enumerate(st.session_state.messages):
                         </div>
                     </div>
                 </div>
-                """, unsafe_allow_html=True)
-        try:
-            sources_json = json.dumps(msg["sources"], ensure_ascii=False, indent=2)
-            st.download_button(
-                label=f"⬇️ Export Sources JSON (message {i+1})",
-                file_name=f"sources_message_{i+1}.json",
-                mime="application/json",
-                data=sources_json,
-                key=f"download_sources_{i}"
-            )
-        except Exception as _e:
-            st.caption(f"Unable to export sources JSON: {_e}")
+                """
+
+# Show sources blocks (outside scroll to keep window performant).
+# Card HTML is built once per sources list and reused on later reruns; each entry holds
+# its list so the id() key cannot be reused while cached
+_prev_sources_render = st.session_state.get("_sources_render_cache", {})
+_sources_render = {}
+for i, msg in enumerate(st.session_state.messages):
+    if msg.get("role") == "assistant" and msg.get("sources"):
+        sources = msg["sources"]
+        rendered = _prev_sources_render.get(id(sources))
+        if rendered is None or rendered[0] is not sources:
+            rendered = (sources, "".join(_render_source_card(source) for source in sources))
+        _sources_render[id(sources)] = rendered
+
+        exp_label = f"📚 Sources Used ({len(sources)} documents)"
+        with st.expander(exp_label, expanded=False):
+            st.markdown(rendered[1], unsafe_allow_html=True)
+        # JSON is serialized only when the button is clicked (where Streamlit supports it)
+        st.download_button(
+            label=f"⬇️ Export Sources JSON (message {i+1})",
+            file_name=f"sources_message_{i+1}.json",
+            mime="application/json",
+            data=_download_data(lambda sources=sources: json.dumps(sources, ensure_ascii=False, indent=2)),
+            key=f"download_sources_{i}"
+        )
+st.session_state._sources_render_cache = _sources_render
 
 # --- 7. Handle User Input ---
 
-def create_rag_prompt(user_query: str, context: str) -> str:
-    """Create a prompt that includes retrieved context"""
-    return f"""You are a helpful AI assistant. Use the following context from uploaded documents to answer the user's question. If the context doesn't contain relevant information, you can still provide a general response, but mention that you don't have specific information from the uploaded documents.
+# Prompt templates, filled with str.format (user text is only ever a format argument)
+RAG_PROMPT_TEMPLATE = """You are a helpful AI assistant. Use the following context from uploaded documents to answer the user's question. If the context doesn't contain relevant information, you can still provide a general response, but mention that you don't have specific information from the uploaded documents.
 
 Context from uploaded documents:
 {context}
@@ -1361,39 +1641,24 @@ User question: {user_query}
 
 Please provide a helpful and accurate response based on the context above. If you use information from the context, mention which document it came from."""
 
-def create_simple_prompt(user_query: str) -> str:
-    """Create a simple prompt without RAG context"""
-    return f"""You are a helpful AI assistant. Please answer the following question:
+SIMPLE_PROMPT_TEMPLATE = """You are a helpful AI assistant. Please answer the following question:
 
 {user_query}"""
 
-import math  # placed here to avoid reordering large header region
-try:
-    import tiktoken as _tiktoken  # optional precise token counting
-    _encoder = _tiktoken.get_encoding("cl100k_base")
-except Exception:  # noqa
-    _tiktoken = None
-    _encoder = None
+def create_rag_prompt(user_query: str, context: str) -> str:
+    """Create a prompt that includes retrieved context"""
+    return RAG_PROMPT_TEMPLATE.format(context=context, user_query=user_query)
+
+def create_simple_prompt(user_query: str) -> str:
+    """Create a simple prompt without RAG context"""
+    return SIMPLE_PROMPT_TEMPLATE.format(user_query=user_query)
 
 # --- Message Limit & Token Tracking Setup (lightweight heuristic) ---
-if "token_estimate_total" not in st.session_state:
-    st.session_state.token_estimate_total = 0
-if "message_count" not in st.session_state:
-    st.session_state.message_count = 0
+st.session_state.setdefault("message_count", 0)
 
-message_limit = int(os.getenv("CHAT_MESSAGE_LIMIT", "50"))
+message_limit = _CHAT_MESSAGE_LIMIT
 warn_threshold = max(1, int(message_limit * 0.8))
 
-def estimate_tokens(text: str) -> int:
-    if not text:
-        return 0
-    if _encoder is not None:
-        try:
-            return len(_encoder.encode(text))
-        except Exception:
-            pass
-    return max(1, math.ceil(len(text) / 4))  # fallback heuristic
-
 limit_reached = st.session_state.message_count >= message_limit
 
 st.markdown("<div style='margin: 2rem 0;'></div>", unsafe_allow_html=True)
@@ -1427,7 +1692,6 @@ if prompt:
     # Track analytics for user query
     if "analytics_tracker" in st.session_state:
         analytics = st.session_state.analytics_tracker
-        import uuid
         event_id = str(uuid.uuid4())[:12]
         
         analytics.track_event(AnalyticsEvent(
@@ -1444,19 +1708,25 @@ if prompt:
             }
         ))
     
-    st.session_state.messages.append({"role": "user", "content": prompt, "model": chosen_msg_model or st.session_state.get("selected_model")})
+    st.session_state.messages.append({
+        "role": "user",
+        "content": prompt,
+        "model": chosen_msg_model or st.session_state.get("selected_model"),
+        "tokens": estimate_tokens(prompt),
+    })
     st.session_state.message_count += 1
-    st.session_state.token_estimate_total += estimate_tokens(prompt)
     if st.session_state.message_count == warn_threshold:
         st.toast(f"You've used {st.session_state.message_count}/{message_limit} messages (≈80%).", icon="⚠️")
-    st.rerun()
+    # Answered below in this same run; the history above was drawn before this message existed
+    with st.chat_message("user"):
+        st.write(prompt)
     
 # Process the latest message if it's from user and hasn't been responded to
 if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
     latest_prompt = st.session_state.messages[-1]["content"]
 
-    with st.empty():
-        st.markdown("""
+    response_placeholder = st.empty()
+    response_placeholder.markdown("""
         <div style="display: flex; justify-content: flex-start; margin: 1.5rem 0;">
             <div style="background: var(--surface); border: 1px solid var(--border-color); padding: 1rem 1.25rem; border-radius: var(--radius-lg); box-shadow: var(--shadow-sm);">
                 <div style="display: flex; align-items: center; gap: 0.5rem;">
@@ -1477,53 +1747,97 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
         sources_used = []
         rag_retrieval_time = 0
         
-        if use_rag:
-            rag_start = datetime.now()
-            vector_db_info = st.session_state.vector_db.get_collection_info()
-            if vector_db_info.get("document_count", 0) > 0:
-                search_results = st.session_state.vector_db.similarity_search(latest_prompt, n_results=num_context_docs)
-                if search_results:
-                    context = st.session_state.vector_db.get_relevant_context(
-                        latest_prompt,
-                        n_results=num_context_docs,
-                        max_context_length=max_context_length
-                    )
-                    for result in search_results:
-                        sources_used.append({
-                            "source": result["metadata"].get("source", "Unknown"),
-                            "chunk_index": result["metadata"].get("chunk_index", "N/A"),
-                            "distance": result["distance"],
-                            "preview": result["document"]
-                        })
+        # Reuse the answer to a near-identical earlier query under the same documents and settings.
+        # Only while the model chat has no turns yet: such answers do not depend on chat history
+        db_version = getattr(st.session_state.vector_db, "version", 0)
+        cache_key = (db_version, reply_model, use_rag, num_context_docs, max_context_length)
+        history_free = reply_model not in st.session_state.model_chats
+        # An exact repeat of a recent query also reuses its embedding and retrieval
+        retrieval_key = _retrieval_cache_key(latest_prompt, db_version, use_rag, num_context_docs, max_context_length)
+        retrieved = _retrieval_cache_get(retrieval_key)
+        query_vec = retrieved[0] if retrieved else None
+        cached = None
+        try:
+            if query_vec is None:
+                query_vec = st.session_state.vector_db.embed_query(latest_prompt)
+            if history_free:
+                cached = _semantic_cache().lookup(query_vec, cache_key)
+        except Exception:
+            pass
+
+        if cached is not None:
+            answer, cached_sources = cached
+            sources_used = list(cached_sources)
+            ai_response_time = 0
+            # Start the model chat with this turn so follow-up questions still see it
+            try:
+                get_chat_for_model(reply_model, history=[
+                    {"role": "user", "parts": [{"text": latest_prompt}]},
+                    {"role": "model", "parts": [{"text": answer}]},
+                ])
+            except Exception:
+                pass
+        else:
+            if use_rag:
+                rag_start = datetime.now()
+                if _kb_has_docs(st.session_state.vector_db):
+                    if retrieved is not None:
+                        _, search_results, context = retrieved
+                    else:
+                        # One embedding + search feeds both the sources list and the prompt context
+                        search_results, context = st.session_state.vector_db.search_with_context(
+                            latest_prompt,
+                            n_results=num_context_docs,
+                            max_context_length=max_context_length,
+                            query_embedding=query_vec
+                        )
+                        _retrieval_cache_put(retrieval_key, (query_vec, search_results, context))
+                    if search_results:
+                        for result in search_results:
+                            sources_used.append({
+                                "source": result["metadata"].get("source", "Unknown"),
+                                "chunk_index": result["metadata"].get("chunk_index", "N/A"),
+                                "distance": result["distance"],
+                                "preview": result["document"]
+                            })
                         
-                        # Track document engagement
-                        if "analytics_tracker" in st.session_state:
-                            analytics = st.session_state.analytics_tracker
-                            analytics.track_document_engagement(
-                                document_name=result["metadata"].get("source", "Unknown"),
-                                engagement_type="retrieval",
-                                relevance_score=1 - result["distance"],  # Convert distance to relevance
-                                chunk_index=result["metadata"].get("chunk_index", 0),
-                                query=latest_prompt
-                            )
+                            # Track document engagement
+                            if "analytics_tracker" in st.session_state:
+                                analytics = st.session_state.analytics_tracker
+                                analytics.track_document_engagement(
+                                    document_name=result["metadata"].get("source", "Unknown"),
+                                    engagement_type="retrieval",
+                                    relevance_score=1 - result["distance"],  # Convert distance to relevance
+                                    chunk_index=result["metadata"].get("chunk_index", 0),
+                                    query=latest_prompt
+                                )
                     
-                    final_prompt = create_rag_prompt(latest_prompt, context)
+                        final_prompt = create_rag_prompt(latest_prompt, context)
+                    else:
+                        final_prompt = create_simple_prompt(latest_prompt)
                 else:
                     final_prompt = create_simple_prompt(latest_prompt)
+                rag_retrieval_time = (datetime.now() - rag_start).total_seconds()
             else:
                 final_prompt = create_simple_prompt(latest_prompt)
-            rag_retrieval_time = (datetime.now() - rag_start).total_seconds()
-        else:
-            final_prompt = create_simple_prompt(latest_prompt)
 
-        chat_obj = get_chat_for_model(reply_model)
-        
-        # Track AI response generation time
-        ai_start = datetime.now()
-        response = chat_obj.send_message(final_prompt)
-        ai_response_time = (datetime.now() - ai_start).total_seconds()
+            chat_obj = get_chat_for_model(reply_model)
         
-        answer = response.text if hasattr(response, "text") else str(response)
+            # Track AI response generation time
+            ai_start = datetime.now()
+            if hasattr(chat_obj, "send_message_stream"):
+                # Stream the reply into the placeholder as chunks arrive
+                answer = ""
+                for chunk in chat_obj.send_message_stream(final_prompt):
+                    if getattr(chunk, "text", None):
+                        answer += chunk.text
+                        response_placeholder.markdown(answer + "▌")
+            else:
+                response = chat_obj.send_message(final_prompt)
+                answer = response.text if hasattr(response, "text") else str(response)
+            ai_response_time = (datetime.now() - ai_start).total_seconds()
+            if history_free and query_vec is not None:
+                _semantic_cache().add(query_vec, cache_key, answer, sources_used)
         total_response_time = (datetime.now() - start_time).total_seconds()
         
         # Track performance metrics
@@ -1534,7 +1848,6 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
             analytics.track_performance("total_response_time", total_response_time)
             
             # Track response analytics
-            import uuid
             event_id = str(uuid.uuid4())[:12]
             analytics.track_event(AnalyticsEvent(
                 id=event_id,
@@ -1548,20 +1861,19 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                     "model_used": reply_model,
                     "rag_used": use_rag and len(sources_used) > 0,
                     "response_time": total_response_time,
-                    "query_length": len(latest_prompt)
+                    "query_length": len(latest_prompt),
+                    "cache_hit": cached is not None
                 }
             ))
         
-        st.session_state.token_estimate_total += estimate_tokens(answer or "")
         st.session_state.message_count += 1
         # Resolve actual model (fallback may have occurred)
         chat_actual = getattr(st.session_state.model_chats.get(reply_model, {}), "_actual_model", reply_model)
-        message_data = {"role": "assistant", "content": answer, "model": chat_actual, "requested_model": reply_model}
+        message_data = {"role": "assistant", "content": answer, "model": chat_actual, "requested_model": reply_model, "tokens": estimate_tokens(answer or "")}
         if sources_used:
             message_data["sources"] = sources_used
         st.session_state.messages.append(message_data)
         st.session_state.message_count += 1
-        st.session_state.token_estimate_total += estimate_tokens(answer)
         
         # Auto-save conversation after every assistant response
         if "conv_manager" in st.session_state and len(st.session_state.messages) >= 2:
@@ -1577,31 +1889,35 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                 title = generate_conversation_title(current_messages)
                 category = auto_categorize_conversation(current_messages)
                 
-                # Get creation time (preserve if conversation exists, otherwise use now)
-                existing_conv = conv_manager.load_conversation(conv_id)
-                created_time = existing_conv.created_at if existing_conv else datetime.now()
+                # Get creation time (preserve if conversation exists, otherwise use now);
+                # remembered per conversation so later saves skip the database read
+                if st.session_state.get("_conversation_created_at_id") != conv_id:
+                    existing_conv = conv_manager.load_conversation(conv_id)
+                    st.session_state._conversation_created_at = existing_conv.created_at if existing_conv else datetime.now()
+                    st.session_state._conversation_created_at_id = conv_id
+                created_time = st.session_state._conversation_created_at
                 
                 conversation = Conversation(
                     id=conv_id,
                     title=title,
-                    messages=current_messages,
+                    messages=list(current_messages),  # snapshot: the save runs in the background
                     created_at=created_time,
                     updated_at=datetime.now(),
                     category=category,
                     message_count=len(current_messages),
-                    total_tokens=st.session_state.get("token_estimate_total", 0)
+                    total_tokens=_token_estimate_total()
                 )
                 
-                conv_manager.save_conversation(conversation)
-            except Exception:
-                pass  # Silent auto-save failure
+                # Checked (and awaited) by the sidebar on the rerun below
+                st.session_state._pending_save = conv_manager.save_conversation_async(conversation)
+            except Exception as e:
+                st.warning(f"⚠️ Conversation auto-save failed: {e}")
         
         st.rerun()
     except Exception as e:
         error_message = f"I apologize, but I encountered an error: {str(e)}"
-        st.session_state.messages.append({"role": "assistant", "content": error_message, "model": reply_model})
+        st.session_state.messages.append({"role": "assistant", "content": error_message, "model": reply_model, "tokens": estimate_tokens(error_message)})
         st.session_state.message_count += 1
-        st.session_state.token_estimate_total += estimate_tokens(error_message)
         st.rerun()
 
 # --- 8. Enhanced Footer and Help Section ---
@@ -1635,95 +1951,3 @@ st.markdown("""
     </div>
 </div>
 """, unsafe_allow_html=True)
-
-# Add final CSS for animations that need to be loaded after content
-st.markdown("""
-<style>
-@keyframes pulse {
-    0%, 100% { opacity: 1; }
-    50% { opacity: 0.5; }
-}
-
-@keyframes fadeIn {
-    from { opacity: 0; transform: translateY(10px); }
-    to { opacity: 1; transform: translateY(0); }
-}
-
-.modern-card {
-    animation: fadeIn 0.3s ease-out;
-}
-
-/* Smooth scroll behavior */
-html {
-    scroll-behavior: smooth;
-}
-
-/* Enhanced focus states */
-button:focus, input:focus, textarea:focus {
-    outline: 2px solid var(--primary-color);
-    outline-offset: 2px;
-}
-
-/* Loading states */
-.stSpinner > div {
-    border-color: var(--primary-color) transparent transparent transparent;
-}
-
-/* Better scrollbar */
-::-webkit-scrollbar {
-    width: 8px;
-    height: 8px;
-}
-
-::-webkit-scrollbar-track {
-    background: var(--surface-variant);
-    border-radius: 4px;
-}
-
-::-webkit-scrollbar-thumb {
-    background: var(--border-color);
-    border-radius: 4px;
-}
-
-::-webkit-scrollbar-thumb:hover {
-    background: var(--text-tertiary);
-}
-</style>
-""", unsafe_allow_html=True)
-
-# Inject a small JS snippet once to handle all copy buttons reliably
-st.markdown(
-    """
-    <script>
-    (function() {
-        function attach() {
-            document.querySelectorAll('.copy-btn').forEach(btn => {
-                if (btn.dataset._bound) return;
-                btn.dataset._bound = '1';
-                btn.addEventListener('click', async () => {
-                    const targetId = btn.getAttribute('data-target');
-                    const el = document.getElementById(targetId);
-                    if (!el) return;
-                    try {
-                        await navigator.clipboard.writeText(el.innerText);
-                        const original = btn.innerText;
-                        btn.innerText = 'Copied!';
-                        btn.disabled = true;
-                        setTimeout(()=>{ btn.innerText = original; btn.disabled = false; }, 1400);
-                    } catch(e) {
-                        console.warn('Copy failed', e);
-                        btn.innerText = 'Failed';
-                        setTimeout(()=>{ btn.innerText = 'Copy'; }, 1400);
-                    }
-                });
-            });
-        }
-        // Initial attach & on mutation (Streamlit re-renders root frequently)
-        const observer = new MutationObserver(() => attach());
-        observer.observe(document.body, { childList: true, subtree: true });
-        attach();
-    })();
-    </script>
-    """,
-    unsafe_allow_html=True
-)
\ No newline at end of file
@@ -0,0 +1,280 @@
+"""
+Test the analytics tracker storage (batching, roll-ups and dashboard queries)
+"""
+
+from analytics_dashboard import AnalyticsTracker, AnalyticsEvent
+from datetime import datetime, timedelta
+import json
+import os
+import sqlite3
+import tempfile
+
+
+def _event(event_id, event_type="message", session_id="s1", **metadata):
+    """AnalyticsEvent stamped now"""
+    return AnalyticsEvent(
+        id=event_id,
+        timestamp=datetime.now(),
+        event_type=event_type,
+        session_id=session_id,
+        metadata=metadata or None
+    )
+
+
+def _event_ids(tracker):
+    return {row[0] for row in tracker._conn.execute("SELECT id FROM analytics_events")}
+
+
+def test_flush_survives_bad_rows():
+    """A duplicate id is skipped without losing the rest of the batch; other failures keep the batch"""
+    print("🧪 Testing flush error handling...")
+    with tempfile.TemporaryDirectory() as tmp:
+        tracker = AnalyticsTracker(os.path.join(tmp, "analytics.db"))
+        try:
+            tracker.track_event(_event("dup"))
+            tracker.flush()
+
+            # Duplicate primary key next to a valid event in the same batch
+            tracker.track_event(_event("dup"))
+            tracker.track_event(_event("fresh"))
+            tracker.track_performance("response_time", 1.5)
+            tracker.flush()
+            assert _event_ids(tracker) == {"dup", "fresh"}
+            assert tracker._conn.execute("SELECT SUM(count) FROM events_daily").fetchone()[0] == 2
+            assert tracker.get_usage_stats()["total_events"] == 2
+            print("✅ Duplicate row skipped, rest of the batch written")
+
+            # Any other failure leaves the rows buffered for the next flush
+            tracker._conn.execute("ALTER TABLE analytics_events RENAME TO analytics_events_moved")
+            tracker.track_event(_event("retry"))
+            try:
+                tracker.flush()
+            except sqlite3.Error:
+                pass
+            assert tracker._pending() == 1
+            tracker._conn.execute("ALTER TABLE analytics_events_moved RENAME TO analytics_events")
+            tracker.flush()
+            assert _event_ids(tracker) == {"dup", "fresh", "retry"}
+            print("✅ Failed batch kept and written on retry")
+        finally:
+            tracker.flush_and_close()
+
+
+# Schema and dashboard queries of the original (pre roll-up) tracker
+LEGACY_SCHEMA = """
+    CREATE TABLE analytics_events (
+        id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, event_type TEXT NOT NULL,
+        user_id TEXT DEFAULT 'anonymous', session_id TEXT DEFAULT '', metadata TEXT DEFAULT '{}'
+    );
+    CREATE TABLE performance_metrics (
+        id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, metric_type TEXT NOT NULL,
+        value REAL NOT NULL, metadata TEXT DEFAULT '{}'
+    );
+    CREATE TABLE document_engagement (
+        id TEXT PRIMARY KEY, document_name TEXT NOT NULL, timestamp TEXT NOT NULL,
+        engagement_type TEXT NOT NULL, relevance_score REAL DEFAULT 0,
+        chunk_index INTEGER DEFAULT 0, query TEXT DEFAULT ''
+    );
+    CREATE INDEX idx_events_timestamp ON analytics_events(timestamp);
+    CREATE INDEX idx_events_type ON analytics_events(event_type);
+    CREATE INDEX idx_performance_timestamp ON performance_metrics(timestamp);
+    CREATE INDEX idx_engagement_document ON document_engagement(document_name);
+"""
+
+
+def _legacy_results(conn, days):
+    """Dashboard results computed with the original queries over the raw tables"""
+    since = (datetime.now() - timedelta(days=days)).isoformat()
+    events_by_type = dict(conn.execute(
+        "SELECT event_type, COUNT(*) FROM analytics_events WHERE timestamp >= ? GROUP BY event_type", (since,)
+    ).fetchall())
+    usage = {
+        "total_events": sum(events_by_type.values()),
+        "events_by_type": events_by_type,
+        "daily_activity": dict(conn.execute(
+            "SELECT DATE(timestamp), COUNT(*) FROM analytics_events WHERE timestamp >= ? GROUP BY DATE(timestamp)", (since,)
+        ).fetchall()),
+        "unique_sessions": conn.execute(
+            "SELECT COUNT(DISTINCT session_id) FROM analytics_events WHERE timestamp >= ? AND session_id != ''", (since,)
+        ).fetchone()[0],
+        "period_days": days
+    }
+    documents = {
+        "top_documents": [
+            {"document": name, "engagement_count": count, "avg_relevance": round(avg, 3) if avg else 0}
+            for name, count, avg in conn.execute("""
+                SELECT document_name, COUNT(*) AS n, AVG(relevance_score) FROM document_engagement
+                WHERE timestamp >= ? GROUP BY document_name ORDER BY n DESC LIMIT 10
+            """, (since,))
+        ],
+        "engagement_types": dict(conn.execute(
+            "SELECT engagement_type, COUNT(*) FROM document_engagement WHERE timestamp >= ? GROUP BY engagement_type", (since,)
+        ).fetchall()),
+        "relevance_over_time": dict(conn.execute("""
+            SELECT DATE(timestamp), AVG(relevance_score) FROM document_engagement
+            WHERE timestamp >= ? AND relevance_score > 0 GROUP BY DATE(timestamp)
+        """, (since,)).fetchall())
+    }
+    trends = {}
+    for day, metric_type, avg in conn.execute("""
+        SELECT DATE(timestamp), metric_type, AVG(value) FROM performance_metrics
+        WHERE timestamp >= ? GROUP BY DATE(timestamp), metric_type
+    """, (since,)):
+        trends.setdefault(metric_type, {})[day] = round(avg, 3)
+    performance = {
+        "avg_times": {
+            metric_type: {"avg": round(avg, 3), "count": count}
+            for metric_type, avg, count in conn.execute("""
+                SELECT metric_type, AVG(value), COUNT(*) FROM performance_metrics
+                WHERE timestamp >= ? AND metric_type LIKE '%_time' GROUP BY metric_type
+            """, (since,))
+        },
+        "performance_trends": trends
+    }
+    queries = [
+        {"query": query, "frequency": count, "avg_response_length": round(avg, 1) if avg else 0}
+        for query, count, avg in conn.execute("""
+            SELECT JSON_EXTRACT(metadata, '$.query') AS q, COUNT(*) AS n,
+                   AVG(CAST(JSON_EXTRACT(metadata, '$.response_length') AS REAL))
+            FROM analytics_events
+            WHERE timestamp >= ? AND event_type = 'query' AND q IS NOT NULL
+            GROUP BY q ORDER BY n DESC LIMIT 20
+        """, (since,))
+    ]
+    return usage, documents, performance, queries
+
+
+def _seed_legacy_rows(conn):
+    """Rows spread over the last few days; counts are distinct so result orderings are unambiguous"""
+    now = datetime.now()
+    for i in range(12):
+        ts = (now - timedelta(days=i % 4, minutes=i)).isoformat()
+        event_type = "query" if i < 6 else ("message" if i < 10 else "document_upload")
+        metadata = {"query": "what is rag" if i < 4 else "compare models", "response_length": 100 + 10 * i} if event_type == "query" else {}
+        conn.execute(
+            "INSERT INTO analytics_events (id, timestamp, event_type, session_id, metadata) VALUES (?, ?, ?, ?, ?)",
+            (f"e{i}", ts, event_type, f"s{i % 3}", json.dumps(metadata))
+        )
+    for i, (metric_type, value) in enumerate([("response_time", 1.5), ("response_time", 0.5), ("rag_retrieval_time", 0.25), ("tokens", 200.0)]):
+        conn.execute(
+            "INSERT INTO performance_metrics (id, timestamp, metric_type, value) VALUES (?, ?, ?, ?)",
+            (f"p{i}", (now - timedelta(days=i % 2)).isoformat(), metric_type, value)
+        )
+    for i, (document, relevance) in enumerate([("a.pdf", 0.75), ("a.pdf", 0.5), ("a.pdf", 0.0), ("b.txt", 0.25), ("b.txt", 0.5), ("c.docx", 0.75)]):
+        conn.execute(
+            "INSERT INTO document_engagement (id, document_name, timestamp, engagement_type, relevance_score) VALUES (?, ?, ?, ?, ?)",
+            (f"d{i}", document, (now - timedelta(days=i % 3)).isoformat(), "retrieval", relevance)
+        )
+
+
+def test_legacy_database_migration():
+    """A database with the original schema is migrated and reports what the original queries did"""
+    print("🧪 Testing legacy analytics migration...")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "analytics.db")
+        legacy = sqlite3.connect(db_path)
+        legacy.executescript(LEGACY_SCHEMA)
+        _seed_legacy_rows(legacy)
+        legacy.commit()
+        usage, documents, performance, queries = _legacy_results(legacy, 30)
+        legacy.close()
+        
+        tracker = AnalyticsTracker(db_path)
+        try:
+            assert tracker.get_usage_stats(30) == usage
+            assert tracker.get_document_analytics(30) == documents
+            assert tracker.get_performance_analytics(30) == performance
+            assert tracker.get_popular_queries(30) == queries
+            assert usage["total_events"] == 12 and queries[0] == {"query": "what is rag", "frequency": 4, "avg_response_length": 115.0}
+            print("✅ Migrated database matches the original queries")
+        finally:
+            tracker.flush_and_close()
+
+
+def _track_sample(tracker, batch):
+    """Track a mix of events, metrics and engagements (varied by batch number)"""
+    for i in range(5 + batch):
+        tracker.track_event(_event(
+            f"b{batch}-e{i}",
+            event_type="query" if i % 2 else "message",
+            session_id=f"s{(i + batch) % 4}",
+            query=f"question {i % 3}",
+            response_length=50 * (i + 1)
+        ))
+    tracker.track_performance("response_time", 0.5 * (batch + 1))
+    tracker.track_performance("tokens", 100.0 + batch)
+    tracker.track_document_engagement(f"doc{batch % 2}.pdf", "retrieval", relevance_score=0.25 * batch, query="q")
+
+
+def test_dashboard_bundle_matches_getters():
+    """get_dashboard_bundle returns exactly what the individual get_* methods return"""
+    print("🧪 Testing dashboard bundle...")
+    with tempfile.TemporaryDirectory() as tmp:
+        tracker = AnalyticsTracker(os.path.join(tmp, "analytics.db"))
+        try:
+            for batch in range(3):
+                _track_sample(tracker, batch)
+            bundle = tracker.get_dashboard_bundle(30, query_limit=10)
+            assert bundle["usage_stats"] == tracker.get_usage_stats(30)
+            assert bundle["document_analytics"] == tracker.get_document_analytics(30)
+            assert bundle["performance_analytics"] == tracker.get_performance_analytics(30)
+            assert bundle["popular_queries"] == tracker.get_popular_queries(30, limit=10)
+            assert bundle["usage_stats"]["total_events"] == 18
+            print("✅ Bundle matches the per-method results")
+        finally:
+            tracker.flush_and_close()
+
+
+def test_rollups_across_flushes():
+    """Daily roll-ups stay equal to aggregates of the raw rows after several flushes"""
+    print("🧪 Testing roll-up maintenance...")
+    with tempfile.TemporaryDirectory() as tmp:
+        tracker = AnalyticsTracker(os.path.join(tmp, "analytics.db"))
+        try:
+            for batch in range(4):
+                _track_sample(tracker, batch)
+                tracker.flush()
+            conn = tracker._conn
+            checks = [
+                ("SELECT day, event_type, count FROM events_daily",
+                 "SELECT day, event_type, COUNT(*) FROM analytics_events GROUP BY day, event_type"),
+                ("SELECT day, session_id FROM sessions_daily",
+                 "SELECT DISTINCT day, session_id FROM analytics_events WHERE session_id != ''"),
+                ("SELECT day, metric_type, sum_value, count FROM perf_daily",
+                 "SELECT day, metric_type, SUM(value), COUNT(*) FROM performance_metrics GROUP BY day, metric_type"),
+                ("SELECT day, document_name, engagement_type, count, sum_relevance FROM engagement_daily",
+                 "SELECT day, document_name, engagement_type, COUNT(*), SUM(relevance_score) FROM document_engagement GROUP BY 1, 2, 3"),
+            ]
+            for rollup_sql, raw_sql in checks:
+                assert sorted(conn.execute(rollup_sql).fetchall()) == sorted(conn.execute(raw_sql).fetchall()), rollup_sql
+            assert conn.execute("SELECT SUM(count) FROM events_daily").fetchone()[0] == 5 + 6 + 7 + 8
+            print("✅ Roll-ups match the raw rows")
+        finally:
+            tracker.flush_and_close()
+
+
+def test_flush_and_close_drains_pending_rows():
+    """Rows still queued when the tracker closes are written before the connection closes"""
+    print("🧪 Testing flush on close...")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "analytics.db")
+        tracker = AnalyticsTracker(db_path)
+        _track_sample(tracker, 0)
+        tracker.flush_and_close()
+        
+        conn = sqlite3.connect(db_path)
+        try:
+            counts = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("analytics_events", "performance_metrics", "document_engagement")]
+            assert counts == [5, 2, 1]
+            print("✅ Pending rows written on close")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    test_flush_survives_bad_rows()
+    test_legacy_database_migration()
+    test_dashboard_bundle_matches_getters()
+    test_rollups_across_flushes()
+    test_flush_and_close_drains_pending_rows()
@@ -3,8 +3,11 @@ Test the enhanced conversation memory system
 """
 
 from conversation_manager import ConversationManager, Conversation
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import os
+import sqlite3
+import tempfile
 
 def test_conversation_memory():
     """Test basic conversation memory functionality"""
@@ -82,15 +85,175 @@ def test_conversation_memory():
     success = manager.delete_conversation("test_conv_001")
     print(f"✅ Delete successful: {success}")
     
-    # Cleanup
-    import os
-    try:
-        os.remove("test_conversations.db")
-        print("🧹 Test database cleaned up")
-    except:
-        pass
+    # Cleanup: closing the connection checkpoints the WAL; remove any sidecar files regardless
+    manager.close()
+    for path in ("test_conversations.db", "test_conversations.db-wal", "test_conversations.db-shm"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    print("🧹 Test database cleaned up")
     
     print("🎉 All tests completed!")
 
+
+def _make_conversation(conv_id, title, messages=None, summary="", updated_at=None):
+    """Conversation with sensible defaults for the storage tests"""
+    messages = messages or [{"role": "user", "content": f"Question about {title}"}]
+    updated_at = updated_at or datetime.now()
+    return Conversation(
+        id=conv_id,
+        title=title,
+        messages=messages,
+        created_at=updated_at,
+        updated_at=updated_at,
+        summary=summary
+    )
+
+
+def test_large_conversation_round_trip():
+    """Messages above the compression threshold are stored zlib-compressed and load back intact"""
+    print("🧪 Testing compressed message storage...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConversationManager(os.path.join(tmp, "conversations.db"))
+        try:
+            messages = [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}: " + "lorem ipsum " * 40}
+                for i in range(20)
+            ]
+            assert manager.save_conversation(_make_conversation("big", "Large conversation", messages))
+            
+            stored = manager._conn.execute("SELECT messages FROM conversations WHERE id = 'big'").fetchone()[0]
+            assert isinstance(stored, bytes) and stored[:1] == b"x"
+            
+            loaded = manager.load_conversation("big")
+            assert loaded is not None and loaded.messages == messages
+            print("✅ Large conversation round-trips through zlib")
+        finally:
+            manager.close()
+
+
+def test_legacy_text_row_migration():
+    """A database from the old schema (messages as JSON TEXT) is migrated and still loads"""
+    print("🧪 Testing legacy TEXT rows...")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "conversations.db")
+        messages = [
+            {"role": "user", "content": "How do I debug this function?"},
+            {"role": "assistant", "content": "Start by reading the traceback."}
+        ]
+        now = datetime.now().isoformat()
+        legacy = sqlite3.connect(db_path)
+        legacy.execute("""
+            CREATE TABLE conversations (
+                id TEXT PRIMARY KEY, title TEXT NOT NULL, messages TEXT NOT NULL,
+                created_at TEXT NOT NULL, updated_at TEXT NOT NULL,
+                category TEXT DEFAULT 'general', tags TEXT DEFAULT '[]', summary TEXT DEFAULT '',
+                message_count INTEGER DEFAULT 0, total_tokens INTEGER DEFAULT 0
+            )
+        """)
+        legacy.execute(
+            "INSERT INTO conversations (id, title, messages, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?, ?)",
+            ("legacy", "Legacy chat", json.dumps(messages), now, now, len(messages))
+        )
+        legacy.commit()
+        legacy.close()
+        
+        manager = ConversationManager(db_path)
+        try:
+            loaded = manager.load_conversation("legacy")
+            assert loaded is not None and loaded.messages == messages
+            
+            summary = manager.list_conversations()[0]
+            assert summary.first_user_message == "How do I debug this function?"
+            assert summary.auto_category == "technical"
+            print("✅ Legacy row migrated and loaded")
+        finally:
+            manager.close()
+
+
+def test_search_fts_and_like_fallback():
+    """Search matches title/summary through FTS5 and through the LIKE fallback"""
+    print("🧪 Testing conversation search...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConversationManager(os.path.join(tmp, "conversations.db"))
+        try:
+            manager.save_conversation(_make_conversation("ml", "Machine Learning Basics"))
+            manager.save_conversation(_make_conversation("cook", "Dinner ideas", summary="Pasta recipes"))
+            
+            for fts_enabled in (manager._fts_enabled, False):
+                manager._fts_enabled = fts_enabled
+                assert [c.id for c in manager.list_conversations(search_term="machine")] == ["ml"]
+                assert [c.id for c in manager.list_conversations(search_term="pasta")] == ["cook"]
+                assert manager.list_conversations(search_term="astronomy") == []
+            print("✅ Search works with FTS5 and with the LIKE fallback")
+        finally:
+            manager.close()
+
+
+def test_keyset_pagination():
+    """Paging with after=(updated_at, id) walks every conversation once, newest first"""
+    print("🧪 Testing keyset pagination...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConversationManager(os.path.join(tmp, "conversations.db"))
+        try:
+            base = datetime(2024, 1, 1, 12, 0, 0)
+            for i in range(7):
+                manager.save_conversation(_make_conversation(f"c{i}", f"Conversation {i}", updated_at=base + timedelta(minutes=i)))
+            # Same timestamp as c6: the id breaks the tie
+            manager.save_conversation(_make_conversation("c7", "Conversation 7", updated_at=base + timedelta(minutes=6)))
+            
+            seen = []
+            after = None
+            while True:
+                page = manager.list_conversations(limit=3, after=after)
+                if not page:
+                    break
+                seen.extend(c.id for c in page)
+                after = (page[-1].updated_at, page[-1].id)
+            
+            assert seen == ["c7", "c6", "c5", "c4", "c3", "c2", "c1", "c0"]
+            
+            # Relevance-ranked search cannot continue from a recency key
+            if manager._fts_enabled:
+                try:
+                    manager.list_conversations(search_term="conversation", after=after)
+                    assert False, "after= with an FTS search should raise"
+                except ValueError:
+                    pass
+            print("✅ Keyset pages cover every conversation in order")
+        finally:
+            manager.close()
+
+
+def test_soft_delete_and_compact():
+    """Deleted conversations disappear from list/search/stats at once and are purged by compact()"""
+    print("🧪 Testing soft delete and compaction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConversationManager(os.path.join(tmp, "conversations.db"))
+        try:
+            manager.save_conversation(_make_conversation("keep", "Machine learning notes"))
+            manager.save_conversation(_make_conversation("gone", "Machine translation notes"))
+            assert manager.delete_conversation("gone")
+            
+            assert [c.id for c in manager.list_conversations()] == ["keep"]
+            assert [c.id for c in manager.list_conversations(search_term="machine")] == ["keep"]
+            assert manager.load_conversation("gone") is None
+            assert manager.get_conversation_stats()["total_conversations"] == 1
+            
+            # Not purged until it is older than PURGE_AFTER
+            assert manager.compact() == 0
+            manager._conn.execute("UPDATE conversations SET deleted_at = datetime('now', '-2 days') WHERE id = 'gone'")
+            assert manager.compact() == 1
+            assert manager._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 1
+            print("✅ Soft-deleted conversation hidden, then purged")
+        finally:
+            manager.close()
+
 if __name__ == "__main__":
-    test_conversation_memory()
\ No newline at end of file
+    test_conversation_memory()
+    test_large_conversation_round_trip()
+    test_legacy_text_row_migration()
+    test_search_fts_and_like_fallback()
+    test_keyset_pagination()
+    test_soft_delete_and_compact()
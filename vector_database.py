@@ -6,18 +6,24 @@ Handles document embeddings, storage, and retrieval using ChromaDB
 import streamlit as st
 import os
 import tempfile
-from typing import List, Dict, Any, Optional, Union, Sequence
+from typing import List, Dict, Any, Optional, Union, Sequence, Tuple, Hashable, Callable
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 from langchain.docstore.document import Document as LangChainDocument
 import uuid
 import json
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 # Type aliases for Chroma metadata (must be JSON-serializable primitives)
 MetadataValue = Union[str, int, float, bool, None]
 MetadataDict = Dict[str, MetadataValue]
 
+# Documents embedded and written per Chroma add() call in add_documents
+CHROMA_MAX_BATCH = 500
+
 
 class VectorDatabase:
     """Manages document embeddings and retrieval using ChromaDB"""
@@ -36,6 +42,8 @@ class VectorDatabase:
         """
         self.collection_name = collection_name
         self.embedding_model_name = embedding_model
+        # Bumped on every add/clear so callers can cache collection info until it changes
+        self.version = 0
         
         # Set up persistent directory
         if persist_directory is None:
@@ -109,12 +117,19 @@ class VectorDatabase:
         
         return embeddings.tolist()
     
-    def add_documents(self, documents: List[LangChainDocument]) -> bool:
+    def embed_query(self, query: str) -> np.ndarray:
+        """float32 embedding of a query, as used for searches (see similarity_search's query_embedding)"""
+        return self.embedding_model.encode(query, convert_to_numpy=True).astype(np.float32, copy=False)
+    
+    def add_documents(self,
+                      documents: List[LangChainDocument],
+                      progress_callback: Optional[Callable[[int, int], None]] = None) -> bool:
         """
         Add documents to the vector database
         
         Args:
             documents: List of LangChain Document objects
+            progress_callback: Called as (documents_written, total) after each batch is stored
         
         Returns:
             True if successful, False otherwise
@@ -123,22 +138,9 @@ class VectorDatabase:
             st.warning("No documents to add")
             return False
         
+        # Set once a batch is handed to Chroma: even if a later batch fails, earlier ones are stored
+        submitted = False
         try:
-            # Generate embeddings
-            embeddings = self.embed_documents(documents)
-
-            if not embeddings:
-                st.warning("No embeddings generated; aborting add")
-                return False
-
-            # Convert embeddings to numpy array of type float32 for consistency
-            import numpy as np
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-
-            # Prepare data for ChromaDB
-            ids = [str(uuid.uuid4()) for _ in documents]
-            texts = [doc.page_content for doc in documents]
-
             # Sanitize metadata: keep only JSON-friendly primitives (str, int, float, bool) and skip None/complex
             primitive_types = (str, int, float, bool)
 
@@ -158,31 +160,61 @@ class VectorDatabase:
                             continue
                 return cleaned
 
-            metadatas_list: List[MetadataDict] = [
-                sanitize_metadata(getattr(doc, "metadata", {}) or {}) for doc in documents
-            ]
+            # Chroma rejects oversized add() calls; stay under both our default and the client's limit
+            batch_size = CHROMA_MAX_BATCH
+            try:
+                batch_size = min(batch_size, self.client.get_max_batch_size())
+            except Exception:
+                pass  # older chromadb without get_max_batch_size
 
-            # Add to collection
-            # Suppress potential static type checker complaint; runtime API accepts List[Dict[str, primitive]]
-            # Cast to Any to satisfy static type checker differences between our simplified MetadataDict and Chroma's Metadata
-            metadatas_param: Any = metadatas_list  # type: ignore[assignment]
-            self.collection.add(  # type: ignore
-                ids=ids,
-                embeddings=embeddings_array.tolist(),  # ensure plain list
-                documents=texts,
-                metadatas=metadatas_param
-            )
+            # Embed batch N+1 while batch N is written; one writer thread keeps adds in order
+            with st.spinner(f"Generating embeddings for {len(documents)} documents..."), \
+                    ThreadPoolExecutor(max_workers=1) as writer:
+                pending = None
+                for start in range(0, len(documents), batch_size):
+                    batch = documents[start:start + batch_size]
+                    texts = [doc.page_content for doc in batch]
+                    embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
+                    if len(embeddings) == 0:
+                        st.warning("No embeddings generated; aborting add")
+                        return False
+
+                    # Cast to Any to satisfy static type checker differences between our simplified MetadataDict and Chroma's Metadata
+                    metadatas_param: Any = [  # type: ignore[assignment]
+                        sanitize_metadata(getattr(doc, "metadata", {}) or {}) for doc in batch
+                    ]
+                    if pending is not None:
+                        pending.result()  # surface a failed write before queueing the next one
+                        if progress_callback is not None:
+                            progress_callback(start, len(documents))
+                    pending = writer.submit(
+                        self.collection.add,  # type: ignore
+                        ids=[str(uuid.uuid4()) for _ in batch],
+                        embeddings=embeddings.astype("float32").tolist(),  # plain lists for Chroma
+                        documents=texts,
+                        metadatas=metadatas_param
+                    )
+                    submitted = True
+                if pending is not None:
+                    pending.result()
+                    if progress_callback is not None:
+                        progress_callback(len(documents), len(documents))
 
             st.success(f"✅ Added {len(documents)} documents to vector database")
             return True
         except Exception as e:
             st.error(f"Error adding documents to vector database: {str(e)}")
             return False
+        finally:
+            # Bump on partial success too, so caches keyed on the version see the stored batches
+            if submitted:
+                self.version += 1
     
     def similarity_search(self, 
                          query: str, 
                          n_results: int = 5, 
-                         where: Optional[Dict] = None) -> List[Dict[str, Any]]:
+                         where: Optional[Dict] = None,
+                         query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
         """
         Perform similarity search on the vector database
         
@@ -190,17 +222,19 @@ class VectorDatabase:
             query: Search query text
             n_results: Number of results to return
             where: Optional metadata filter
+            query_embedding: Precomputed embed_query(query), to skip embedding the query again
         
         Returns:
             List of search results with documents and metadata
         """
         try:
             # Generate query embedding
-            query_embedding = self.embedding_model.encode([query], convert_to_tensor=False)
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
             
             # Perform search
             results = self.collection.query(
-                query_embeddings=query_embedding.tolist(),
+                query_embeddings=[query_embedding.tolist()],
                 n_results=n_results,
                 where=where,
                 include=["documents", "metadatas", "distances"]
@@ -249,8 +283,31 @@ class VectorDatabase:
         Returns:
             Formatted context string
         """
-        results = self.similarity_search(query, n_results)
+        return self._format_context(self.similarity_search(query, n_results), max_context_length)
+    
+    def search_with_context(self,
+                            query: str,
+                            n_results: int = 3,
+                            max_context_length: int = 2000,
+                            query_embedding: Optional[np.ndarray] = None) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Run one similarity search and return both its results and the RAG context built from them
         
+        Args:
+            query: Search query
+            n_results: Number of documents to retrieve
+            max_context_length: Maximum length of context to return
+            query_embedding: Precomputed embed_query(query), if already available
+        
+        Returns:
+            (search results as from similarity_search, formatted context string)
+        """
+        results = self.similarity_search(query, n_results, query_embedding=query_embedding)
+        return results, self._format_context(results, max_context_length)
+    
+    @staticmethod
+    def _format_context(results: List[Dict[str, Any]], max_context_length: int) -> str:
+        """Join search results into a source-labelled context string of at most max_context_length"""
         if not results:
             return "No relevant documents found."
         
@@ -282,6 +339,26 @@ class VectorDatabase:
         
         return context
     
+    def stored_chunk_hashes(self, page_size: int = 5000) -> set:
+        """
+        Collect the chunk_hash metadata of every stored chunk
+        
+        Args:
+            page_size: Metadata records fetched per collection.get call
+        
+        Returns:
+            Set of non-empty chunk hashes
+        """
+        hashes = set()
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            metadatas = page.get("metadatas") or ()
+            hashes.update(m["chunk_hash"] for m in metadatas if isinstance(m, dict) and m.get("chunk_hash"))
+            if len(metadatas) < page_size:
+                return hashes
+            offset += page_size
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the current collection"""
         try:
@@ -303,6 +380,7 @@ class VectorDatabase:
             results = self.collection.get()
             if results["ids"]:
                 self.collection.delete(ids=results["ids"])
+                self.version += 1
                 st.success("🗑️ Collection cleared successfully")
             else:
                 st.info("Collection is already empty")
@@ -322,6 +400,65 @@ class VectorDatabase:
             return False
 
 
+class SemanticResponseCache:
+    """
+    Answers to recent queries, looked up by embedding similarity
+    
+    A query whose embedding has cosine similarity >= threshold with a stored one (under the
+    same key, e.g. document-set version and model) reuses that answer instead of calling the LLM.
+    Holds at most `capacity` entries, overwriting the oldest first.
+    """
+    
+    @staticmethod
+    def _unit(vec: np.ndarray) -> np.ndarray:
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+    
+    def __init__(self, threshold: float = 0.92, capacity: int = 512):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim) unit vectors, allocated on first add
+        self._entries: List[Tuple[Hashable, str, List[Dict[str, Any]]]] = []
+        self._next = 0
+    
+    def lookup(self, query_vec: np.ndarray, key: Hashable) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Return (response, sources) of the most similar stored query under `key`, if close enough"""
+        with self._lock:
+            if not self._entries or self._vectors is None or self._vectors.shape[1] != query_vec.shape[0]:
+                return None
+            sims = self._vectors[:len(self._entries)] @ self._unit(query_vec)
+            for i in np.argsort(sims)[::-1]:
+                if sims[i] < self.threshold:
+                    break
+                entry_key, response, sources = self._entries[i]
+                if entry_key == key:
+                    return response, sources
+            return None
+    
+    def add(self, query_vec: np.ndarray, key: Hashable, response: str, sources: List[Dict[str, Any]]):
+        """Store an answer for a query embedding"""
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query_vec.shape[0]:
+                self._vectors = np.empty((self.capacity, query_vec.shape[0]), dtype=np.float32)
+                self._entries = []
+                self._next = 0
+            self._vectors[self._next] = self._unit(query_vec)
+            entry = (key, response, sources)
+            if self._next < len(self._entries):
+                self._entries[self._next] = entry
+            else:
+                self._entries.append(entry)
+            self._next = (self._next + 1) % self.capacity
+    
+    def clear(self):
+        """Drop all stored answers"""
+        with self._lock:
+            self._entries = []
+            self._next = 0
+
+
 @st.cache_resource
 def get_vector_database(collection_name: str = "document_store") -> VectorDatabase:
     """